@@ -0,0 +1,153 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import torch
+
+from chatbotapp import LOAD_MODES, load_config, load_model, load_tokenizer, stop_token_ids
+
+# Headless batched generation for evaluation sets:
+#   python batch_generate.py models/gpt2 prompts.jsonl results.jsonl --batch-size 16 --threads 8
+# Every input line is {"id": ..., "prompt": ...}; a missing id defaults to the line number.
+# Results are appended one line per prompt, so a crashed run continues where it stopped when restarted.
+
+def read_prompts(path):
+    prompts = []
+    with open(path) as file:
+        for line_number, line in enumerate(file):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompts.append((str(record.get("id", line_number)), record["prompt"]))
+    return prompts
+
+def finished_ids(path):
+    # A last line cut short by a crash is dropped, so appending continues on a clean line;
+    # other unreadable lines are skipped and their prompts generated again
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    complete_bytes = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            complete_bytes += len(line)
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError, TypeError):
+                print(f"Skipping unreadable result line: {line[:80]!r}", file=sys.stderr)
+    if complete_bytes != os.path.getsize(path):
+        with open(path, "r+b") as file:
+            file.truncate(complete_bytes)
+    return done
+
+def make_batches(items, batch_size, max_batch_tokens=None):
+    # Sorted by length so each batch holds prompts of similar size and pads little
+    items = sorted(items, key=lambda item: len(item[2]))
+    batch = []
+    for item in items:
+        padded_tokens = len(item[2]) * (len(batch) + 1)
+        if batch and (len(batch) >= batch_size or (max_batch_tokens and padded_tokens > max_batch_tokens)):
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+def completion_length(tokens, stop_ids):
+    # Rows are cut at the first stop id; everything after it is padding
+    for index, token in enumerate(tokens.tolist()):
+        if token in stop_ids:
+            return index
+    return len(tokens)
+
+def generate_batch(model, tokenizer, batch, max_new_tokens, temperature, stop_ids):
+    encoded = tokenizer.pad({"input_ids": [item[2] for item in batch]}, padding=True, return_tensors="pt")
+    input_length = encoded["input_ids"].shape[-1]
+    options = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+    with torch.inference_mode():
+        outputs = model.generate(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"],
+                                 max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id, **options)
+    results = []
+    for item, sequence in zip(batch, outputs):
+        generated = sequence[input_length:]
+        length = completion_length(generated, stop_ids)
+        results.append({"id": item[0], "prompt": item[1],
+                        "response": tokenizer.decode(generated[:length], skip_special_tokens=True),
+                        "prompt_tokens": len(item[2]), "completion_tokens": length})
+    return results, input_length * len(batch)
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through a local model in batches")
+    parser.add_argument("model_path", help="Path to a downloaded model, e.g. models/gpt2")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"prompt\"} object per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--load-mode", choices=LOAD_MODES, default=config["load_mode"])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-tokens", type=int, help="Upper bound on padded prompt tokens per batch")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads, defaults to torch's choice")
+    parser.add_argument("--max-new-tokens", type=int, default=config["max_new_tokens"])
+    parser.add_argument("--temperature", type=float, default=0.0, help="0 for greedy decoding")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    prompts = read_prompts(args.input)
+    done = finished_ids(args.output)
+    pending = [(prompt_id, prompt) for prompt_id, prompt in prompts if prompt_id not in done]
+    print(f"{len(prompts)} prompts, {len(prompts) - len(pending)} already done, {len(pending)} to generate",
+          file=sys.stderr)
+    if not pending:
+        return
+
+    tokenizer = load_tokenizer(args.model_path)
+    # Decoder-only models continue from the last position, so prompts are padded on the left
+    tokenizer.padding_side = "left"
+    # Over-long prompts lose their beginning rather than the end the model has to continue from
+    tokenizer.truncation_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = load_model(args.model_path, args.load_mode)
+    stop_ids = stop_token_ids(model, tokenizer)
+
+    max_prompt_tokens = max(config["max_context_tokens"] - args.max_new_tokens, 1)
+    items = [(prompt_id, prompt, tokenizer(prompt, truncation=True, max_length=max_prompt_tokens)["input_ids"])
+             for prompt_id, prompt in pending]
+
+    start = time.perf_counter()
+    generated_tokens = prompt_tokens = padded_tokens = finished = 0
+    with open(args.output, "a") as output:
+        for batch in make_batches(items, args.batch_size, args.max_batch_tokens):
+            results, batch_padded_tokens = generate_batch(model, tokenizer, batch, args.max_new_tokens,
+                                                          args.temperature, stop_ids)
+            for result in results:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                generated_tokens += result["completion_tokens"]
+                prompt_tokens += result["prompt_tokens"]
+            # Flushed per batch so a crash loses at most the batch in flight
+            output.flush()
+            os.fsync(output.fileno())
+            padded_tokens += batch_padded_tokens
+            finished += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"{finished}/{len(items)} prompts, {generated_tokens / elapsed:.1f} tok/s", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "prompts": finished,
+        "elapsed_s": round(elapsed, 3),
+        "generated_tokens": generated_tokens,
+        "tokens_per_s": round(generated_tokens / elapsed, 2),
+        "prompts_per_s": round(finished / elapsed, 3),
+        "padding_efficiency": round(prompt_tokens / padded_tokens, 3) if padded_tokens else None,
+        "batch_size": args.batch_size,
+        "threads": torch.get_num_threads(),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import platform
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_ollama import StubConfig, StubOllamaServer
+
+RESPONSE_TIMEOUT = 120
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def distribution(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    def pick(fraction):
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(pick(0.5) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+class ChatBenchmark:
+    # Drives the real send_message / get_response path of ollama_chat_gtk_1.ChatWindow against the stub server
+    def __init__(self, args):
+        from gi.repository import GLib
+        import ollama_chat_gtk_1
+
+        self.args = args
+        self.GLib = GLib
+        self.callbacks = {"idle_add": 0, "timeout_add": 0}
+        self.install_callback_counters()
+
+        self.window = ollama_chat_gtk_1.ChatWindow()
+        self.window.auto_select_checkbox.set_active(False)
+
+        self.arrivals = []
+        self.inserts = []
+        self.response_done = threading.Event()
+        self.instrument_window()
+
+    def install_callback_counters(self):
+        GLib = self.GLib
+        self.original_idle_add = GLib.idle_add
+        original_timeout_add = GLib.timeout_add
+
+        def counted_idle_add(*args, **kwargs):
+            self.callbacks["idle_add"] += 1
+            return self.original_idle_add(*args, **kwargs)
+
+        def counted_timeout_add(*args, **kwargs):
+            self.callbacks["timeout_add"] += 1
+            return original_timeout_add(*args, **kwargs)
+
+        GLib.idle_add = counted_idle_add
+        GLib.timeout_add = counted_timeout_add
+
+    def instrument_window(self):
+        window = self.window
+        original_stream = window.ollama.chat_stream
+        original_get_response = window.get_response
+
+        async def timed_stream(**kwargs):
+            async for part in original_stream(**kwargs):
+                if part['message']['content']:
+                    self.arrivals.append(time.perf_counter())
+                yield part
+
+        async def timed_get_response(*args, **kwargs):
+            try:
+                await original_get_response(*args, **kwargs)
+            finally:
+                self.response_done.set()
+
+        window.ollama.chat_stream = timed_stream
+        window.get_response = timed_get_response
+        window.chat_buffer.connect_after("insert-text", lambda buffer, location, text, length:
+                                         self.inserts.append(time.perf_counter()))
+
+    def call_on_main_thread(self, func, *args):
+        # The driver's own callbacks go through the unpatched idle_add so they are not counted
+        done = threading.Event()
+        result = {}
+
+        def run():
+            result["value"] = func(*args)
+            done.set()
+            return False
+
+        self.original_idle_add(run)
+        done.wait()
+        return result.get("value")
+
+    def send(self, text):
+        def send_on_main_thread():
+            self.window.input_buffer.set_text(text)
+            self.window.send_message(None)
+            return time.perf_counter()
+        return self.call_on_main_thread(send_on_main_thread)
+
+    def wait_for_renderer(self):
+        renderer = self.window.renderer
+        while True:
+            with renderer.lock:
+                if not renderer.pending and not renderer.scheduled:
+                    return
+            time.sleep(0.001)
+
+    def wait_for_catalog(self):
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline:
+            if self.call_on_main_thread(lambda: list(self.window.available_models)):
+                return
+            time.sleep(0.05)
+        raise RuntimeError("the window never received the model catalog from the stub server")
+
+    def run(self):
+        self.wait_for_catalog()
+        ttfts, ui_ttfts, gaps, totals = [], [], [], []
+        rss_samples = [(0, current_rss_mb())]
+        tokens = 0
+        callbacks_before = dict(self.callbacks)
+        flushes_before = self.window.renderer.flushes
+        start = time.perf_counter()
+
+        for index in range(self.args.messages):
+            self.arrivals.clear()
+            self.response_done.clear()
+            sent_at = self.send(f"Wiadomość testowa numer {index}")
+            if not self.response_done.wait(RESPONSE_TIMEOUT):
+                raise RuntimeError(f"no response to message {index}")
+            self.wait_for_renderer()
+            finished_at = time.perf_counter()
+
+            arrivals = list(self.arrivals)
+            if arrivals:
+                ttfts.append(arrivals[0] - sent_at)
+                shown = [moment for moment in self.inserts if moment >= arrivals[0]]
+                if shown:
+                    ui_ttfts.append(shown[0] - sent_at)
+                gaps.extend(later - earlier for earlier, later in zip(arrivals, arrivals[1:]))
+            totals.append(finished_at - sent_at)
+            tokens += self.args.response_tokens
+            self.inserts.clear()
+            if (index + 1) % max(self.args.messages // 10, 1) == 0:
+                rss_samples.append((index + 1, current_rss_mb()))
+
+        elapsed = time.perf_counter() - start
+        callbacks = {name: self.callbacks[name] - callbacks_before[name] for name in self.callbacks}
+        flushes = self.window.renderer.flushes - flushes_before
+        first_rss, last_rss = rss_samples[0][1], rss_samples[-1][1]
+        return {
+            "messages": self.args.messages,
+            "elapsed_s": round(elapsed, 3),
+            "ttft": distribution(ttfts),
+            "ui_ttft": distribution(ui_ttfts),
+            "inter_chunk": distribution(gaps),
+            "response_total": distribution(totals),
+            "throughput_tokens_per_s": round(tokens / elapsed, 1),
+            "gtk_callbacks": callbacks,
+            "gtk_callbacks_per_s": round(sum(callbacks.values()) / elapsed, 1),
+            "renderer_flushes": flushes,
+            "rss_mb": [[count, round(rss, 1)] for count, rss in rss_samples],
+            "rss_growth_mb_per_100_messages": round((last_rss - first_rss) * 100 / self.args.messages, 2),
+            "connections": {"requests": self.window.ollama.stats.requests,
+                            "new": self.window.ollama.stats.new_connections},
+        }
+
+def compare(results, baseline):
+    lines = []
+    for key in ("ttft", "ui_ttft", "inter_chunk", "response_total"):
+        old, new = baseline["results"].get(key, {}), results.get(key, {})
+        if old.get("p95_ms") and new.get("p95_ms"):
+            change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+            lines.append(f"{key} p95: {old['p95_ms']} -> {new['p95_ms']} ms ({change:+.1%})")
+    old, new = baseline["results"]["throughput_tokens_per_s"], results["throughput_tokens_per_s"]
+    lines.append(f"throughput: {old} -> {new} tok/s ({(new - old) / old:+.1%})")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless end-to-end chat benchmark against a stub Ollama server. "
+                                                 "Needs a display, e.g. run it under xvfb-run.")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--output", default="bench_chat.json")
+    parser.add_argument("--baseline", help="Previous output file to compare against")
+    args = parser.parse_args()
+
+    stub = StubOllamaServer(StubConfig(args.token_rate, args.chunk_tokens, args.latency,
+                                       args.response_tokens)).start()
+    # Everything the window reads or writes is pointed at the stub and a throwaway directory
+    scratch = tempfile.mkdtemp(prefix="bench_chat_")
+    os.environ["OLLAMA_HOST"] = stub.url
+    os.environ["OLLAMA_CATALOG_URL"] = f"{stub.url}/catalog"
+    os.environ["XDG_CACHE_HOME"] = os.path.join(scratch, "cache")
+    os.environ["XDG_DATA_HOME"] = os.path.join(scratch, "data")
+
+    import gi
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk
+
+    if not Gtk.init_check(sys.argv)[0]:
+        sys.exit("GTK could not open a display; run the benchmark under xvfb-run")
+
+    benchmark = ChatBenchmark(args)
+    outcome = {}
+
+    def drive():
+        try:
+            outcome["results"] = benchmark.run()
+        except Exception as e:
+            outcome["error"] = str(e)
+        benchmark.original_idle_add(Gtk.main_quit)
+
+    threading.Thread(target=drive, daemon=True).start()
+    Gtk.main()
+    stub.stop()
+
+    if "error" in outcome:
+        sys.exit(f"Benchmark failed: {outcome['error']}")
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": outcome["results"],
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(outcome["results"], indent=2))
+    if args.baseline:
+        with open(args.baseline) as file:
+            print(compare(outcome["results"], json.load(file)))
+
+if __name__ == '__main__':
+    main()
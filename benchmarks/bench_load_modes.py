@@ -0,0 +1,82 @@
+import sys
+import os
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPT = "The quick brown fox jumps over the lazy dog. Once upon a time"
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(model_path, load_mode, new_tokens):
+    import torch
+    from chatbotapp import LOAD_MODES, load_model, load_tokenizer, model_memory_bytes
+
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {load_mode}")
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    tokenizer = load_tokenizer(model_path)
+    model = load_model(model_path, load_mode)
+    load_time = time.perf_counter() - start
+    load_peak_rss = peak_rss_mb()
+
+    inputs = tokenizer(PROMPT, return_tensors='pt')
+    with torch.no_grad():
+        start = time.perf_counter()
+        outputs = model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False)
+        generate_time = time.perf_counter() - start
+    generated = outputs.shape[-1] - inputs["input_ids"].shape[-1]
+
+    return {
+        "mode": load_mode,
+        "load_time_s": round(load_time, 3),
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "load_peak_rss_mb": round(load_peak_rss, 1),
+        "model_memory_mb": round(model_memory_bytes(model) / (1024 * 1024), 1),
+        "tokens_per_s": round(generated / generate_time, 2),
+    }
+
+def run_isolated(model_path, load_mode, new_tokens):
+    # Every mode runs in a fresh interpreter, otherwise peak RSS would carry over between modes
+    command = [sys.executable, os.path.abspath(__file__), model_path, "--child", load_mode,
+               "--new-tokens", str(new_tokens)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"mode": load_mode, "error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare load time, peak RSS and tokens/s across load modes")
+    parser.add_argument("model_path", help="Path to a downloaded model, e.g. models/gpt2")
+    parser.add_argument("--modes", default="fp32,mmap,bf16,int8")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.model_path, args.child, args.new_tokens)))
+        return
+
+    results = [run_isolated(args.model_path, mode, args.new_tokens) for mode in args.modes.split(",")]
+    print(f"{'mode':<6} {'load s':>8} {'peak RSS MB':>12} {'model MB':>10} {'tok/s':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['mode']:<6} error: {' '.join(result['error'])}")
+            continue
+        print(f"{result['mode']:<6} {result['load_time_s']:>8} {result['load_peak_rss_mb']:>12} "
+              f"{result['model_memory_mb']:>10} {result['tokens_per_s']:>8}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"model": args.model_path, "results": results}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
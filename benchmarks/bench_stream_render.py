@@ -0,0 +1,127 @@
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, GLib
+
+from stream_renderer import StreamRenderer
+
+PROBE_INTERVAL_MS = 16
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def run(mode, chunks, chunk_size, rate, interval_ms):
+    buffer = Gtk.TextBuffer()
+    loop = GLib.MainLoop()
+    sent_at = [0.0] * chunks
+    latencies = []
+    probe_delays = []
+    state = {"callbacks": 0, "rendered_chars": 0, "rendered_chunks": 0, "producer_done": False}
+
+    def on_insert(buffer, location, text, length):
+        state["rendered_chars"] += len(text)
+        # Chunks have a fixed size, so the character count tells how many have reached the buffer
+        done = state["rendered_chars"] // chunk_size
+        now = time.perf_counter()
+        for index in range(state["rendered_chunks"], done):
+            latencies.append(now - sent_at[index])
+        state["rendered_chunks"] = done
+        if done == chunks:
+            loop.quit()
+
+    buffer.connect_after("insert-text", on_insert)
+
+    if mode == "coalesced":
+        renderer = StreamRenderer(buffer, interval_ms)
+        original_flush = renderer.flush
+
+        def counted_flush():
+            state["callbacks"] += 1
+            return original_flush()
+
+        renderer.flush = counted_flush
+        write = renderer.write
+    else:
+        def insert(text):
+            state["callbacks"] += 1
+            buffer.insert_at_cursor(text)
+            return False
+
+        def write(text):
+            GLib.idle_add(insert, text)
+
+    def produce():
+        chunk = "x" * chunk_size
+        delay = 1.0 / rate if rate else 0.0
+        start = time.perf_counter()
+        for index in range(chunks):
+            if delay:
+                target = start + index * delay
+                pause = target - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+            sent_at[index] = time.perf_counter()
+            write(chunk)
+        state["producer_done"] = True
+
+    # A periodic probe stands in for UI work; how late it fires is the latency a user would feel
+    probe = {"expected": None}
+
+    def on_probe():
+        now = time.perf_counter()
+        if probe["expected"] is not None:
+            probe_delays.append(max(now - probe["expected"], 0.0))
+        probe["expected"] = now + PROBE_INTERVAL_MS / 1000
+        return True
+
+    GLib.timeout_add(PROBE_INTERVAL_MS, on_probe)
+    GLib.timeout_add_seconds(120, loop.quit)
+    start = time.perf_counter()
+    threading.Thread(target=produce, daemon=True).start()
+    loop.run()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 3),
+        "callbacks": state["callbacks"],
+        "callbacks_per_s": round(state["callbacks"] / elapsed, 1),
+        "render_latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        "render_latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "ui_delay_p95_ms": round(percentile(probe_delays, 0.95) * 1000, 2),
+        "ui_delay_max_ms": round(max(probe_delays, default=0.0) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-chunk idle_add with the coalescing StreamRenderer")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2000, help="Chunks per second, 0 for as fast as possible")
+    parser.add_argument("--interval-ms", type=int, default=16)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = [run(mode, args.chunks, args.chunk_size, args.rate, args.interval_ms)
+               for mode in ("per-chunk", "coalesced")]
+    print(f"{'mode':<10} {'callbacks/s':>12} {'latency ms':>11} {'p95 ms':>8} {'UI p95 ms':>10} {'UI max ms':>10}")
+    for result in results:
+        print(f"{result['mode']:<10} {result['callbacks_per_s']:>12} {result['render_latency_mean_ms']:>11} "
+              f"{result['render_latency_p95_ms']:>8} {result['ui_delay_p95_ms']:>10} {result['ui_delay_max_ms']:>10}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+
+# Stand-in for the `ollama pull` command line, for exercising pull_queue without network access:
+#   OLLAMA_BIN=benchmarks/fake_ollama.py python ollama_chat_gtk_1.py
+# Progress is redrawn with \r and ANSI escapes like the real client. Partial downloads are remembered
+# in FAKE_OLLAMA_STATE, so a paused pull continues where it stopped. Models named "missing..." fail.
+STATE_DIR = os.environ.get("FAKE_OLLAMA_STATE", os.path.join(tempfile.gettempdir(), "fake_ollama"))
+RATE = float(os.environ.get("FAKE_OLLAMA_RATE", 200e6))
+LAYER_SIZES = [int(float(size)) for size in os.environ.get("FAKE_OLLAMA_LAYERS", "2e9,1.2e4,4.8e2").split(",")]
+STEP = 0.1
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1000 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1000
+
+def draw(digest, completed, total, rate):
+    percent = int(completed * 100 / total)
+    bar = "█" * (percent // 5) + " " * (20 - percent // 5)
+    sys.stderr.write(f"\r\x1b[Kpulling {digest[:12]}... {percent:3d}% ▕{bar}▏ "
+                     f"{format_size(completed)}/{format_size(total)}  {format_size(rate)}/s")
+    sys.stderr.flush()
+
+def pull(model):
+    if model.startswith("missing"):
+        sys.stderr.write("pulling manifest \nError: pull model manifest: file does not exist\n")
+        return 1
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state_path = os.path.join(STATE_DIR, hashlib.sha256(model.encode()).hexdigest() + ".json")
+    try:
+        with open(state_path) as file:
+            done = json.load(file)
+    except (OSError, ValueError):
+        done = {}
+    sys.stderr.write("\x1b[?25lpulling manifest \n")
+    try:
+        for index, size in enumerate(LAYER_SIZES):
+            digest = hashlib.sha256(f"{model}/{index}".encode()).hexdigest()
+            completed = done.get(digest, 0)
+            while completed < size:
+                time.sleep(STEP)
+                completed = min(size, completed + int(RATE * STEP))
+                done[digest] = completed
+                draw(digest, completed, size, RATE)
+            draw(digest, size, size, 0)
+            sys.stderr.write("\n")
+    except KeyboardInterrupt:
+        with open(state_path, "w") as file:
+            json.dump(done, file)
+        sys.stderr.write("\x1b[?25h\n")
+        return 130
+    sys.stderr.write("verifying sha256 digest \nwriting manifest \nsuccess \x1b[?25h\n")
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return 0
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "pull":
+        sys.stderr.write("fake ollama only supports: pull MODEL\n")
+        return 2
+    return pull(sys.argv[2])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chat import distribution
+from stub_ollama import MODEL, StubConfig, StubOllamaServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 120
+
+def stream_completion(host, port, model, prompt, max_tokens):
+    # Returns (status, time to first content, total time, content chunks)
+    body = json.dumps({"model": model, "messages": [{"role": "user", "content": prompt}],
+                       "max_tokens": max_tokens, "stream": True})
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(host, port, timeout=600)
+    try:
+        connection.request("POST", "/v1/chat/completions", body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            response.read()
+            return response.status, None, time.perf_counter() - start, 0
+        first = None
+        chunks = 0
+        for line in response:
+            if not line.startswith(b"data: ") or line.strip() == b"data: [DONE]":
+                continue
+            event = json.loads(line[6:])
+            if "error" in event:
+                return 502, first, time.perf_counter() - start, chunks
+            if event["choices"][0]["delta"].get("content"):
+                chunks += 1
+                if first is None:
+                    first = time.perf_counter() - start
+        return 200, first, time.perf_counter() - start, chunks
+    finally:
+        connection.close()
+
+def wait_for_server(host, port):
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/metrics")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not start")
+
+def run_load(args, host, port):
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        for index in counter:
+            outcome = stream_completion(host, port, args.model, f"Prompt number {index}", args.max_tokens)
+            with lock:
+                results.append(outcome)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [result for result in results if result[0] == 200]
+    statuses = {}
+    for result in results:
+        statuses[result[0]] = statuses.get(result[0], 0) + 1
+    chunks = sum(result[3] for result in ok)
+    return {
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "ttft": distribution([result[1] for result in ok if result[1] is not None]),
+        "latency": distribution([result[2] for result in ok]),
+        "completed_per_s": round(len(ok) / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent streaming load test for serve.py")
+    parser.add_argument("--url", help="Already running server, e.g. http://127.0.0.1:8000; "
+                                      "without it serve.py is started in front of a stub Ollama server")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--server-concurrency", type=int, default=4)
+    parser.add_argument("--server-queue", type=int, default=8)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stub tokens per second")
+    parser.add_argument("--output", default="load_test_serve.json")
+    args = parser.parse_args()
+
+    stub = server = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        stub = StubOllamaServer(StubConfig(args.token_rate, response_tokens=args.max_tokens)).start()
+        host, port = "127.0.0.1", 18000
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py"), "--backend", "ollama",
+                                   "--model", args.model, "--port", str(port),
+                                   "--max-concurrency", str(args.server_concurrency),
+                                   "--max-queue", str(args.server_queue)],
+                                  env={**os.environ, "OLLAMA_HOST": stub.url})
+    try:
+        wait_for_server(host, port)
+        results = run_load(args, host, port)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if stub is not None:
+            stub.stop()
+
+    with open(args.output, "w") as file:
+        json.dump({"timestamp": time.time(), "config": vars(args), "results": results}, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL = "stub:latest"
+CONTEXT_LENGTH = 8192
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def model_entry(name):
+    return {
+        "name": name,
+        "model": name,
+        "modified_at": now_iso(),
+        "size": 1,
+        "digest": "0" * 64,
+        "details": {"format": "gguf", "family": "stub", "parameter_size": "1B", "quantization_level": "Q4_0"},
+    }
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    # Speaks just enough of the Ollama HTTP API for the chat window: streaming chat, tags, ps, show, generate
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        config = self.server.config
+        if self.path == "/api/tags":
+            self.send_json({"models": [model_entry(MODEL)]})
+        elif self.path == "/api/ps":
+            self.send_json({"models": [model_entry(MODEL)]})
+        elif self.path == "/catalog":
+            self.send_json({"models": [{"name": MODEL.split(":")[0], "tags": ["latest"]}]})
+        elif self.path == "/api/version":
+            self.send_json({"version": "0.0.0-stub"})
+        else:
+            self.send_json({"error": f"unknown path {self.path}"}, 404)
+        config.record_request()
+
+    def do_POST(self):
+        config = self.server.config
+        config.record_request()
+        request = self.read_json()
+        if self.path == "/api/chat":
+            self.stream_chat(request)
+        elif self.path == "/api/show":
+            self.send_json({"modelfile": "", "parameters": "", "template": "", "details": {},
+                            "model_info": {"stub.context_length": CONTEXT_LENGTH}})
+        elif self.path == "/api/generate":
+            self.send_json({"model": request.get("model", MODEL), "created_at": now_iso(), "response": "",
+                            "done": True})
+        else:
+            self.send_json({"error": f"unknown path {self.path}"}, 404)
+
+    def stream_chat(self, request):
+        config = self.server.config
+        model = request.get("model", MODEL)
+        prompt_chars = sum(len(message.get("content", "")) for message in request.get("messages", []))
+        start = time.perf_counter()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(config.latency)
+        eval_start = time.perf_counter()
+        token_interval = 1.0 / config.token_rate if config.token_rate else 0.0
+        sent = 0
+        while sent < config.response_tokens:
+            count = min(config.chunk_tokens, config.response_tokens - sent)
+            deadline = eval_start + (sent + count) * token_interval
+            pause = deadline - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+            part = {"model": model, "created_at": now_iso(),
+                    "message": {"role": "assistant", "content": "tok " * count}, "done": False}
+            self.write_chunk(json.dumps(part).encode() + b"\n")
+            sent += count
+        eval_duration = time.perf_counter() - eval_start
+
+        final = {"model": model, "created_at": now_iso(), "message": {"role": "assistant", "content": ""},
+                 "done": True, "done_reason": "stop",
+                 "total_duration": int((time.perf_counter() - start) * 1e9),
+                 "prompt_eval_count": max(prompt_chars // 4, 1), "prompt_eval_duration": int(config.latency * 1e9),
+                 "eval_count": sent, "eval_duration": int(eval_duration * 1e9)}
+        self.write_chunk(json.dumps(final).encode() + b"\n")
+        self.write_chunk(b"")
+
+class StubConfig:
+    def __init__(self, token_rate=200.0, chunk_tokens=1, latency=0.05, response_tokens=100):
+        self.token_rate = token_rate
+        self.chunk_tokens = chunk_tokens
+        self.latency = latency
+        self.response_tokens = response_tokens
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+class StubOllamaServer:
+    def __init__(self, config, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+        self.server.daemon_threads = True
+        self.server.config = config
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama chat API")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Tokens per second, 0 for no delay")
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first chunk")
+    parser.add_argument("--response-tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    config = StubConfig(args.token_rate, args.chunk_tokens, args.latency, args.response_tokens)
+    server = StubOllamaServer(config, port=args.port)
+    print(f"Stub Ollama listening on {server.url}")
+    server.server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,437 @@
 import sys
 import os
 import json
+import gc
+import time
+import threading
 import urllib.parse
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QTextEdit, QPushButton, QLabel, QLineEdit, QComboBox
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from huggingface_hub import snapshot_download
+from collections import OrderedDict
+import torch
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QLabel, QLineEdit, QComboBox, QProgressBar
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextStreamer, StoppingCriteria, StoppingCriteriaList
+from telemetry import Telemetry
+from download_manager import DownloadManager, hub_token, plan_hub_download, parse_repo_id, format_rate
+
+CONFIG_FILE = "chatbotapp.json"
+DEFAULT_CONFIG = {
+    "max_context_tokens": 2048,
+    "max_new_tokens": 100,
+    "model_ram_budget_mb": 8192,
+    "load_mode": "fp32",
+    "download_workers": 4,
+    # Prometheus text file to rewrite after every request and port for a /metrics endpoint, both optional
+    "metrics_file": None,
+    "metrics_port": None,
+}
+
+# fp32: eager full-precision load (original behaviour)
+# mmap: safetensors mapped from disk with low peak memory
+# bf16: bfloat16 weights, half the memory of fp32
+# int8: dynamic int8 quantization of the linear layers
+LOAD_MODES = ["fp32", "mmap", "bf16", "int8"]
+NO_DRAFT_MODEL = "None"
+
+def load_config():
+    config = dict(DEFAULT_CONFIG)
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE) as file:
+                config.update(json.load(file))
+        except (OSError, ValueError) as e:
+            print(f"Error reading {CONFIG_FILE}: {e}")
+    return config
+
+def cache_length(past_key_values):
+    if past_key_values is None:
+        return 0
+    if hasattr(past_key_values, "get_seq_length"):
+        return past_key_values.get_seq_length()
+    return past_key_values[0][0].shape[-2]
+
+def format_size(num_bytes):
+    return f"{num_bytes / (1024 ** 3):.2f} GB"
+
+def tensors_size(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(tensors_size(item) for item in value)
+    return 0
+
+def model_memory_bytes(model):
+    # state_dict also covers the packed weights of dynamically quantized layers, which are not parameters
+    return sum(tensors_size(value) for value in model.state_dict().values())
+
+def weights_size_on_disk(model_path):
+    total = 0
+    for name in os.listdir(model_path):
+        if name.endswith((".safetensors", ".bin", ".pt")):
+            total += os.path.getsize(os.path.join(model_path, name))
+    return total
+
+def load_tokenizer(model_path):
+    return AutoTokenizer.from_pretrained(model_path)
+
+def load_model(model_path, load_mode="fp32"):
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {load_mode}")
+    if load_mode == "fp32":
+        model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True)
+    elif load_mode == "mmap":
+        model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True,
+                                                     use_safetensors=True, low_cpu_mem_usage=True)
+    elif load_mode == "bf16":
+        model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True,
+                                                     torch_dtype=torch.bfloat16, low_cpu_mem_usage=True)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True,
+                                                     torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+def stop_token_ids(model, tokenizer):
+    # generate() ends a row on any generation_config EOS id (chat models often add an end-of-turn id)
+    # and fills the rest of the row with the pad token
+    eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+    ids = set(eos) if isinstance(eos, (list, tuple)) else {eos}
+    ids.update((tokenizer.eos_token_id, tokenizer.pad_token_id))
+    ids.discard(None)
+    return ids
+
+def registry_key(model_path, load_mode):
+    return f"{model_path} [{load_mode}]"
+
+def tokenizers_compatible(tokenizer, draft_tokenizer):
+    # Assisted generation passes token ids between the two models, so they must share one vocabulary
+    if tokenizer.eos_token_id != draft_tokenizer.eos_token_id:
+        return False
+    return tokenizer.get_vocab() == draft_tokenizer.get_vocab()
+
+class ForwardCounter:
+    # Counts the forward passes a model makes while the hook is installed
+    def __init__(self, model):
+        self.calls = 0
+        self.handle = model.register_forward_hook(self.hook)
+
+    def hook(self, module, inputs, output):
+        self.calls += 1
+
+    def remove(self):
+        self.handle.remove()
+
+class ModelRegistry:
+    # Keeps loaded (model, tokenizer) pairs in memory and evicts the least recently used ones over the RAM budget
+    def __init__(self, ram_budget_bytes):
+        self.ram_budget_bytes = ram_budget_bytes
+        self.entries = OrderedDict()
+        # Models the window still holds; evicting them would free nothing
+        self.pinned = set()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def put(self, key, model, tokenizer):
+        with self.lock:
+            self.entries[key] = (model, tokenizer, model_memory_bytes(model))
+            self.entries.move_to_end(key)
+            evicted = self._evict(self.ram_budget_bytes, keep=key)
+        if evicted:
+            gc.collect()
+        return evicted
+
+    def pin(self, *keys):
+        # Models that were just unpinned are evicted if they keep the registry over budget
+        with self.lock:
+            self.pinned = {key for key in keys if key is not None}
+            evicted = self._evict(self.ram_budget_bytes)
+        if evicted:
+            gc.collect()
+        return evicted
+
+    def make_room(self, num_bytes):
+        with self.lock:
+            evicted = self._evict(self.ram_budget_bytes - num_bytes)
+        if evicted:
+            gc.collect()
+        return evicted
+
+    def _evict(self, limit, keep=None):
+        evicted = []
+        for key in list(self.entries):
+            if self._total() <= limit:
+                break
+            if key == keep or key in self.pinned:
+                continue
+            del self.entries[key]
+            evicted.append(key)
+        return evicted
+
+    def _total(self):
+        return sum(entry[2] for entry in self.entries.values())
+
+    def total_bytes(self):
+        with self.lock:
+            return self._total()
+
+    def memory_usage(self):
+        with self.lock:
+            return [(key, entry[2]) for key, entry in self.entries.items()]
+
+class ModelLoader(QThread):
+    progress = pyqtSignal(int, str)
+    model_loaded = pyqtSignal(str, object, object)
+    load_failed = pyqtSignal(str, str)
+
+    def __init__(self, model_path, load_mode):
+        super().__init__()
+        self.model_path = model_path
+        self.load_mode = load_mode
+
+    def run(self):
+        key = registry_key(self.model_path, self.load_mode)
+        try:
+            self.progress.emit(10, "Loading tokenizer...")
+            tokenizer = load_tokenizer(self.model_path)
+            self.progress.emit(30, f"Loading model weights ({self.load_mode})...")
+            model = load_model(self.model_path, self.load_mode)
+            self.progress.emit(100, "Model loaded.")
+            self.model_loaded.emit(key, model, tokenizer)
+        except Exception as e:
+            self.load_failed.emit(key, str(e))
+
+class DownloadWorker(QThread):
+    progress = pyqtSignal(str, int)
+    download_finished = pyqtSignal(str, str, bool)
+
+    def __init__(self, repo_id, model_dir, max_workers):
+        super().__init__()
+        self.repo_id = repo_id
+        self.model_dir = model_dir
+        self.max_workers = max_workers
+        self.manager = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.manager is not None:
+            self.manager.cancel()
+
+    def report(self, manager):
+        lines = []
+        for progress in manager.progress.values():
+            if progress.started is None or progress.finished is not None:
+                continue
+            size = f"{progress.size / (1024 * 1024):.1f}" if progress.size else "?"
+            lines.append(f"{progress.filename}: {progress.done / (1024 * 1024):.1f} / {size} MB, "
+                         f"{format_rate(progress.rate())}")
+        total_size = manager.total_size()
+        percent = int(manager.total_done() * 100 / total_size) if total_size else 0
+        lines.append(f"Total: {manager.total_done() / (1024 * 1024):.1f} MB, {format_rate(manager.total_rate())}")
+        self.progress.emit("\n".join(lines), percent)
+
+    def run(self):
+        name = os.path.basename(self.model_dir)
+        try:
+            token = hub_token()
+            jobs = plan_hub_download(self.repo_id, token=token)
+            if self.cancelled:
+                self.download_finished.emit(name, "Download cancelled.", False)
+                return
+            self.manager = DownloadManager(self.model_dir, jobs, max_workers=self.max_workers, token=token,
+                                           on_progress=self.report)
+            # A cancel that came while the manager was being created
+            if self.cancelled:
+                self.manager.cancel()
+            errors = self.manager.run()
+        except Exception as e:
+            self.download_finished.emit(name, f"Error downloading model: {e}", False)
+            return
+        if errors:
+            details = "\n".join(f"{filename}: {error}" for filename, error in errors.items())
+            self.download_finished.emit(name, f"Download incomplete, run it again to resume:\n{details}", False)
+        else:
+            self.download_finished.emit(name, f"Model downloaded successfully to {self.model_dir}", True)
+
+class ChatSession:
+    # Keeps the token ids and KV cache of a conversation so that each turn only prefills new tokens
+    def __init__(self, tokenizer, max_context_tokens):
+        self.tokenizer = tokenizer
+        self.max_context_tokens = max_context_tokens
+        self.input_ids = None
+        self.past_key_values = None
+
+    def reset(self):
+        self.input_ids = None
+        self.past_key_values = None
+
+    def prepare_turn(self, user_text, max_new_tokens):
+        first_turn = self.input_ids is None
+        new_ids = self.tokenizer(user_text + "\n", return_tensors='pt', add_special_tokens=first_turn).input_ids
+        input_ids = new_ids if first_turn else torch.cat([self.input_ids, new_ids], dim=-1)
+
+        limit = max(self.max_context_tokens - max_new_tokens, 1)
+        if input_ids.shape[-1] > limit:
+            # Cached positions no longer line up after dropping the oldest tokens, so the tail is prefilled again
+            input_ids = input_ids[:, -limit:]
+            self.past_key_values = None
+        return input_ids
+
+    def commit_turn(self, sequences, past_key_values):
+        self.input_ids = sequences
+        self.past_key_values = past_key_values
+
+    def cached_tokens(self):
+        return cache_length(self.past_key_values)
+
+class CancelCriteria(StoppingCriteria):
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancel_event.is_set()
+
+class SignalStreamer(TextStreamer):
+    # Decodes tokens as generate() produces them and hands finished text pieces to the worker
+    def __init__(self, tokenizer, on_text):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text, stream_end=False):
+        if text:
+            self.on_text(text)
+
+class GenerationWorker(QThread):
+    token_received = pyqtSignal(str)
+    first_token = pyqtSignal(float)
+    generation_finished = pyqtSignal(str, bool)
+    generation_failed = pyqtSignal(str)
+
+    def __init__(self, model, tokenizer, session, prompt, max_new_tokens=100, timer=None, assistant_model=None):
+        super().__init__()
+        self.timer = timer
+        self.model = model
+        self.tokenizer = tokenizer
+        self.session = session
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.assistant_model = assistant_model
+        self.prefill_tokens = 0
+        self.reused_tokens = 0
+        self.generated_tokens = 0
+        self.target_calls = 0
+        self.draft_calls = 0
+        self.fallback_reason = None
+        self.cancel_event = threading.Event()
+        self.start_time = None
+        self.first_token_time = None
+        self.pieces = []
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def acceptance_rate(self):
+        # Every verification pass of the main model yields its accepted draft tokens plus one of its own,
+        # and every draft forward pass proposes one token
+        if not self.draft_calls:
+            return None
+        accepted = self.generated_tokens - self.target_calls
+        return min(max(accepted / self.draft_calls, 0.0), 1.0)
+
+    def emit_text(self, text):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+            self.first_token.emit(self.first_token_time - self.start_time)
+        if self.timer is not None:
+            self.timer.token()
+        self.pieces.append(text)
+        self.token_received.emit(text)
+
+    def generate(self, input_ids):
+        past_key_values = self.session.past_key_values
+        options = {}
+        counters = []
+        if self.assistant_model is not None:
+            # The assistant keeps its own cache, so assisted turns prefill the whole conversation
+            past_key_values = None
+            options["assistant_model"] = self.assistant_model
+            counters = [ForwardCounter(self.model), ForwardCounter(self.assistant_model)]
+        self.reused_tokens = cache_length(past_key_values)
+        self.prefill_tokens = input_ids.shape[-1] - self.reused_tokens
+        streamer = SignalStreamer(self.tokenizer, self.emit_text)
+        stopping_criteria = StoppingCriteriaList([CancelCriteria(self.cancel_event)])
+        try:
+            outputs = self.model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                          past_key_values=past_key_values,
+                                          max_new_tokens=self.max_new_tokens, num_return_sequences=1,
+                                          streamer=streamer, stopping_criteria=stopping_criteria,
+                                          use_cache=True, return_dict_in_generate=True, **options)
+        finally:
+            for counter in counters:
+                counter.remove()
+        if counters:
+            self.target_calls, self.draft_calls = counters[0].calls, counters[1].calls
+        self.generated_tokens = outputs.sequences.shape[-1] - input_ids.shape[-1]
+        return outputs
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        if self.timer is not None:
+            self.timer.start()
+        try:
+            input_ids = self.session.prepare_turn(self.prompt, self.max_new_tokens)
+            try:
+                outputs = self.generate(input_ids)
+            except Exception as e:
+                if self.assistant_model is None or self.pieces:
+                    raise
+                # Architectures without assisted generation support redo the turn with plain decoding
+                self.fallback_reason = str(e)
+                self.assistant_model = None
+                outputs = self.generate(input_ids)
+            past_key_values = outputs.past_key_values if self.assistant_model is None else None
+            self.session.commit_turn(outputs.sequences, past_key_values)
+            if self.timer is not None:
+                self.timer.finish(prompt_tokens=input_ids.shape[-1], completion_tokens=self.generated_tokens)
+            self.generation_finished.emit("".join(self.pieces), self.cancel_event.is_set())
+        except Exception as e:
+            if self.timer is not None:
+                self.timer.finish(error=str(e))
+            self.session.reset()
+            self.generation_failed.emit(str(e))
 
 class ChatbotApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.model_key = None
         self.model_path = None
         self.config_path = None
         self.current_model = None
         self.tokenizer = None
+        self.generation_worker = None
+        self.config = load_config()
+        self.session = None
+        self.model_registry = ModelRegistry(self.config["model_ram_budget_mb"] * 1024 * 1024)
+        self.model_loader = None
+        self.download_worker = None
+        self.draft_key = None
+        self.draft_model = None
+        self.draft_tokenizer = None
+        self.draft_compatible = False
+        self.draft_loader = None
+        # Decode tokens/s of plain runs per model, the baseline for the assisted speedup
+        self.plain_rates = {}
+        self.telemetry = Telemetry("chatbotapp", textfile=self.config["metrics_file"])
+        if self.config["metrics_port"]:
+            self.telemetry.serve(int(self.config["metrics_port"]))
         self.initUI()
 
     def initUI(self):
@@ -23,47 +442,128 @@ class ChatbotApp(QWidget):
         self.model_url_input.setPlaceholderText("Enter model URL from Hugging Face")
         self.layout.addWidget(self.model_url_input)
 
+        download_box = QHBoxLayout()
         self.download_button = QPushButton('Download Model')
         self.download_button.clicked.connect(self.download_model)
-        self.layout.addWidget(self.download_button)
+        download_box.addWidget(self.download_button)
+
+        self.cancel_download_button = QPushButton('Cancel Download')
+        self.cancel_download_button.clicked.connect(self.cancel_download)
+        self.cancel_download_button.setEnabled(False)
+        download_box.addWidget(self.cancel_download_button)
+        self.layout.addLayout(download_box)
+
+        self.download_progress = QProgressBar()
+        self.download_progress.setRange(0, 100)
+        self.download_progress.setValue(0)
+        self.layout.addWidget(self.download_progress)
 
         self.model_list = QComboBox()
+        self.draft_combo = QComboBox()
         self.load_model_list()
         self.layout.addWidget(self.model_list)
 
+        self.load_mode_combo = QComboBox()
+        self.load_mode_combo.addItems(LOAD_MODES)
+        if self.config["load_mode"] in LOAD_MODES:
+            self.load_mode_combo.setCurrentText(self.config["load_mode"])
+        self.layout.addWidget(QLabel("Load mode:"))
+        self.layout.addWidget(self.load_mode_combo)
+
         self.load_button = QPushButton('Load Model')
         self.load_button.clicked.connect(self.load_selected_model)
         self.layout.addWidget(self.load_button)
 
+        self.draft_combo.currentTextChanged.connect(self.select_draft_model)
+        self.layout.addWidget(QLabel("Draft model for assisted generation:"))
+        self.layout.addWidget(self.draft_combo)
+
+        self.draft_label = QLabel("")
+        self.layout.addWidget(self.draft_label)
+
+        self.load_progress = QProgressBar()
+        self.load_progress.setRange(0, 100)
+        self.load_progress.setValue(0)
+        self.layout.addWidget(self.load_progress)
+
+        self.memory_label = QLabel("")
+        self.layout.addWidget(self.memory_label)
+
         self.text_input = QTextEdit(self)
         self.layout.addWidget(QLabel("User Input:"))
         self.layout.addWidget(self.text_input)
 
+        generate_box = QHBoxLayout()
         self.generate_button = QPushButton('Generate Response', self)
         self.generate_button.clicked.connect(self.generate_response)
-        self.layout.addWidget(self.generate_button)
+        generate_box.addWidget(self.generate_button)
+
+        self.cancel_button = QPushButton('Cancel', self)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        self.cancel_button.setEnabled(False)
+        generate_box.addWidget(self.cancel_button)
+
+        self.new_chat_button = QPushButton('New Chat', self)
+        self.new_chat_button.clicked.connect(self.new_chat)
+        generate_box.addWidget(self.new_chat_button)
+        self.layout.addLayout(generate_box)
 
         self.text_output = QTextEdit(self)
         self.text_output.setReadOnly(True)
         self.layout.addWidget(QLabel("Chatbot Response:"))
         self.layout.addWidget(self.text_output)
 
+        self.stats_label = QLabel("")
+        self.layout.addWidget(self.stats_label)
+
+        self.metrics_label = QLabel("")
+        self.layout.addWidget(self.metrics_label)
+
         self.setLayout(self.layout)
         self.show()
 
     def download_model(self):
         model_url = self.model_url_input.text()
-        if model_url:
-            try:
-                model_name = urllib.parse.unquote(model_url.split("/")[-1])
-                model_dir = os.path.join("models", model_name)
-                snapshot_download(model_url, local_dir=model_dir)
-                self.text_output.setText(f"Model downloaded successfully to {model_dir}")
-                self.load_model_list()
-            except Exception as e:
-                self.text_output.setText(f"Error downloading model: {e}")
-        else:
+        if not model_url:
             self.text_output.setText("Please enter a model URL from Hugging Face.")
+            return
+        if self.download_worker is not None and self.download_worker.isRunning():
+            self.text_output.setText("A download is already running.")
+            return
+
+        repo_id = parse_repo_id(model_url)
+        model_name = urllib.parse.unquote(repo_id.split("/")[-1])
+        model_dir = os.path.join("models", model_name)
+        self.download_button.setEnabled(False)
+        self.cancel_download_button.setEnabled(True)
+        self.download_progress.setValue(0)
+        self.text_output.setText(f"Downloading {repo_id}...")
+        self.download_worker = DownloadWorker(repo_id, model_dir, self.config["download_workers"])
+        self.download_worker.progress.connect(self.on_download_progress)
+        self.download_worker.download_finished.connect(self.on_download_finished)
+        self.download_worker.start()
+
+    def cancel_download(self):
+        if self.download_worker is not None:
+            self.download_worker.cancel()
+            self.cancel_download_button.setEnabled(False)
+
+    def on_download_progress(self, text, percent):
+        self.download_progress.setValue(percent)
+        self.text_output.setText(text)
+
+    def on_download_finished(self, model_name, message, ok):
+        self.download_button.setEnabled(True)
+        self.cancel_download_button.setEnabled(False)
+        self.text_output.setText(message)
+        if ok:
+            self.download_progress.setValue(100)
+            if self.model_list.findText(model_name) < 0:
+                self.model_list.addItem(model_name)
+            if self.draft_combo.findText(model_name) < 0:
+                self.draft_combo.blockSignals(True)
+                self.draft_combo.addItem(model_name)
+                self.draft_combo.blockSignals(False)
 
     def load_model_list(self):
         self.model_list.clear()
@@ -71,41 +571,242 @@ class ChatbotApp(QWidget):
         if os.path.exists(models_dir):
             model_subdirs = [d for d in os.listdir(models_dir) if os.path.isdir(os.path.join(models_dir, d))]
             self.model_list.addItems(model_subdirs)
+        else:
+            model_subdirs = []
+        selected_draft = self.draft_combo.currentText()
+        self.draft_combo.blockSignals(True)
+        self.draft_combo.clear()
+        self.draft_combo.addItems([NO_DRAFT_MODEL] + model_subdirs)
+        self.draft_combo.setCurrentText(selected_draft or NO_DRAFT_MODEL)
+        self.draft_combo.blockSignals(False)
 
     def load_selected_model(self):
         selected_model = self.model_list.currentText()
-        if selected_model:
-            self.model_path = os.path.join("models", selected_model)
-            self.config_path = self.model_path
-            self.load_model()
-            self.load_tokenizer()
-        else:
+        if not selected_model:
             self.text_output.setText("No model selected.")
+            return
+        if self.model_loader is not None and self.model_loader.isRunning():
+            self.text_output.setText("A model is already being loaded.")
+            return
 
-    def load_model(self):
-        try:
-            self.current_model = AutoModelForCausalLM.from_pretrained(self.config_path, trust_remote_code=True)
-            self.text_output.setText("Model loaded successfully.")
-        except Exception as e:
-            self.text_output.setText(f"Error loading model: {e}")
+        model_path = os.path.join("models", selected_model)
+        load_mode = self.load_mode_combo.currentText()
+        key = registry_key(model_path, load_mode)
+        cached = self.model_registry.get(key)
+        if cached is not None:
+            self.activate_model(key, model_path, *cached)
+            self.load_progress.setValue(100)
+            self.text_output.setText("Model loaded from memory cache.")
+            return
 
-    def load_tokenizer(self):
-        try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.config_path)
-            self.text_output.setText("Tokenizer loaded successfully.")
-        except Exception as e:
-            self.text_output.setText(f"Error loading tokenizer: {e}")
+        evicted = self.model_registry.make_room(weights_size_on_disk(model_path))
+        self.update_memory_label()
+        if evicted:
+            self.text_output.setText(f"Evicted from memory: {', '.join(evicted)}")
+        self.load_button.setEnabled(False)
+        self.load_progress.setValue(0)
+        self.model_loader = ModelLoader(model_path, load_mode)
+        self.model_loader.progress.connect(self.on_load_progress)
+        self.model_loader.model_loaded.connect(self.on_model_loaded)
+        self.model_loader.load_failed.connect(self.on_model_load_failed)
+        self.model_loader.start()
+
+    def on_load_progress(self, percent, message):
+        self.load_progress.setValue(percent)
+        self.stats_label.setText(message)
+
+    def on_model_loaded(self, key, model, tokenizer):
+        self.model_registry.put(key, model, tokenizer)
+        self.activate_model(key, self.model_loader.model_path, model, tokenizer)
+        self.load_button.setEnabled(True)
+        self.text_output.setText("Model loaded successfully.")
+
+    def on_model_load_failed(self, key, error):
+        self.load_button.setEnabled(True)
+        self.load_progress.setValue(0)
+        self.stats_label.setText("")
+        self.text_output.setText(f"Error loading model: {error}")
+
+    def activate_model(self, key, model_path, model, tokenizer):
+        self.model_key = key
+        self.model_path = model_path
+        self.config_path = model_path
+        self.current_model = model
+        self.tokenizer = tokenizer
+        self.session = ChatSession(self.tokenizer, self.config["max_context_tokens"])
+        self.model_registry.pin(self.model_key, self.draft_key)
+        self.update_memory_label()
+        self.check_draft_model()
+
+    def select_draft_model(self, name):
+        if not name or name == NO_DRAFT_MODEL:
+            self.draft_key = self.draft_model = self.draft_tokenizer = None
+            self.model_registry.pin(self.model_key, self.draft_key)
+            self.update_memory_label()
+            self.check_draft_model()
+            return
+        if self.draft_loader is not None and self.draft_loader.isRunning():
+            self.draft_label.setText("A draft model is already being loaded.")
+            return
+        model_path = os.path.join("models", name)
+        key = registry_key(model_path, self.load_mode_combo.currentText())
+        cached = self.model_registry.get(key)
+        if cached is not None:
+            self.on_draft_loaded(key, *cached)
+            return
+        self.draft_label.setText(f"Loading draft model {name}...")
+        self.draft_loader = ModelLoader(model_path, self.load_mode_combo.currentText())
+        self.draft_loader.model_loaded.connect(self.on_draft_loaded)
+        self.draft_loader.load_failed.connect(self.on_draft_load_failed)
+        self.draft_loader.start()
+
+    def on_draft_loaded(self, key, model, tokenizer):
+        self.model_registry.put(key, model, tokenizer)
+        self.draft_key = key
+        self.draft_model = model
+        self.draft_tokenizer = tokenizer
+        self.model_registry.pin(self.model_key, self.draft_key)
+        self.update_memory_label()
+        self.check_draft_model()
+
+    def on_draft_load_failed(self, key, error):
+        self.draft_label.setText(f"Error loading draft model: {error}")
+
+    def check_draft_model(self):
+        # Incompatible drafts stay loaded but are not used, so generation falls back to plain decoding
+        self.draft_compatible = False
+        if self.draft_model is None:
+            self.draft_label.setText("")
+            return
+        name = os.path.basename(self.draft_key)
+        if self.tokenizer is None:
+            self.draft_label.setText(f"Draft model {name} ready, load a main model to use it.")
+        elif self.draft_key == self.model_key:
+            self.draft_label.setText("The draft model is the main model, using plain decoding.")
+        elif not tokenizers_compatible(self.tokenizer, self.draft_tokenizer):
+            self.draft_label.setText(f"Tokenizer of {name} differs from the main model's, using plain decoding.")
+        else:
+            self.draft_compatible = True
+            self.draft_label.setText(f"Assisted generation with draft model {name}.")
+
+    def update_memory_label(self):
+        usage = self.model_registry.memory_usage()
+        models = ", ".join(f"{os.path.basename(key)} ({format_size(size)})" for key, size in usage)
+        budget = format_size(self.model_registry.ram_budget_bytes)
+        total = format_size(self.model_registry.total_bytes())
+        self.memory_label.setText(f"Cached models: {models or 'none'} - {total} / {budget}")
 
     def generate_response(self):
         if self.current_model is None or self.tokenizer is None:
             self.text_output.setText("No model or tokenizer loaded.")
             return
 
+        if self.generation_worker is not None and self.generation_worker.isRunning():
+            return
+
         user_input = self.text_input.toPlainText()
-        inputs = self.tokenizer(user_input, return_tensors='pt')
-        outputs = self.current_model.generate(**inputs, max_length=100, num_return_sequences=1)
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        self.text_output.setText(response)
+        self.text_output.clear()
+        self.stats_label.setText("Generating...")
+        self.generate_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+
+        if self.session is None:
+            self.session = ChatSession(self.tokenizer, self.config["max_context_tokens"])
+        timer = self.telemetry.request(os.path.basename(self.model_path or self.model_key))
+        assistant_model = self.draft_model if self.draft_compatible else None
+        self.generation_worker = GenerationWorker(self.current_model, self.tokenizer, self.session, user_input,
+                                                  self.config["max_new_tokens"], timer, assistant_model)
+        self.generation_worker.token_received.connect(self.append_response_text)
+        self.generation_worker.first_token.connect(self.show_first_token_time)
+        self.generation_worker.generation_finished.connect(self.on_generation_finished)
+        self.generation_worker.generation_failed.connect(self.on_generation_failed)
+        self.generation_worker.start()
+
+    def new_chat(self):
+        if self.generation_worker is not None and self.generation_worker.isRunning():
+            return
+        if self.session is not None:
+            self.session.reset()
+        self.text_output.clear()
+        self.stats_label.setText("New chat started.")
+
+    def cancel_generation(self):
+        if self.generation_worker is not None:
+            self.generation_worker.cancel()
+            self.cancel_button.setEnabled(False)
+
+    def append_response_text(self, text):
+        self.text_output.moveCursor(QTextCursor.End)
+        self.text_output.insertPlainText(text)
+
+    def show_first_token_time(self, seconds):
+        self.stats_label.setText(f"Time to first token: {seconds:.2f} s")
+
+    def on_generation_finished(self, response, cancelled):
+        worker = self.generation_worker
+        total = time.perf_counter() - worker.start_time
+        status = "Cancelled" if cancelled else "Done"
+        cache = f"prefilled {worker.prefill_tokens} tokens, reused {worker.reused_tokens} cached"
+        if worker.first_token_time is not None:
+            ttft = worker.first_token_time - worker.start_time
+            self.stats_label.setText(f"{status} - time to first token: {ttft:.2f} s, total: {total:.2f} s, {cache}")
+        else:
+            self.stats_label.setText(f"{status} - no tokens generated, total: {total:.2f} s, {cache}")
+        self.update_metrics_label(worker.timer)
+        self.update_assisted_stats(worker)
+        self.generate_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def update_assisted_stats(self, worker):
+        tokens_per_second = worker.timer.tokens_per_second
+        if worker.assistant_model is None:
+            if tokens_per_second:
+                self.plain_rates[self.model_key] = tokens_per_second
+            if worker.fallback_reason is not None:
+                self.draft_label.setText(f"Assisted generation failed ({worker.fallback_reason}), "
+                                         f"used plain decoding.")
+            return
+        acceptance = worker.acceptance_rate()
+        parts = [f"acceptance {acceptance:.0%}" if acceptance is not None else "acceptance -"]
+        baseline = self.plain_rates.get(self.model_key)
+        if tokens_per_second and baseline:
+            parts.append(f"{tokens_per_second:.1f} tok/s vs {baseline:.1f} plain "
+                         f"({tokens_per_second / baseline:.2f}x)")
+        elif tokens_per_second:
+            parts.append(f"{tokens_per_second:.1f} tok/s, no plain baseline yet (generate once with draft None)")
+        self.draft_label.setText(f"Assisted by {os.path.basename(self.draft_key)}: {', '.join(parts)}")
+
+    def update_metrics_label(self, timer):
+        lines = []
+        if timer.tokens_per_second:
+            lines.append(f"Last request: {timer.completion_tokens} tokens at {timer.tokens_per_second:.1f} tok/s, "
+                         f"prompt {timer.prompt_tokens} tokens")
+        for model, stats in self.telemetry.snapshot().items():
+            ttft = f"{stats['ttft_p50'] * 1000:.0f} ms" if stats['ttft_p50'] is not None else "-"
+            gap = f"{stats['inter_token_p95'] * 1000:.0f} ms" if stats['inter_token_p95'] is not None else "-"
+            lines.append(f"{model}: {stats['requests']} requests, {stats['errors']} errors, "
+                         f"TTFT p50 <= {ttft}, inter-token p95 <= {gap}")
+        self.metrics_label.setText("\n".join(lines))
+
+    def closeEvent(self, event):
+        # Qt aborts if a QThread object is destroyed while its thread still runs
+        if self.generation_worker is not None:
+            self.generation_worker.cancel()
+        if self.download_worker is not None:
+            self.download_worker.cancel()
+        # Model loading cannot be interrupted, so closing waits for it
+        for thread in (self.generation_worker, self.download_worker, self.model_loader, self.draft_loader):
+            if thread is not None and thread.isRunning():
+                thread.wait()
+        self.telemetry.close()
+        super().closeEvent(event)
+
+    def on_generation_failed(self, error):
+        self.text_output.setText(f"Error generating response: {error}")
+        self.stats_label.setText("")
+        self.update_metrics_label(self.generation_worker.timer)
+        self.generate_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import codecs
+import signal
+import threading
+import traceback
+import subprocess
+
+CPU_SECONDS = 10
+WALL_SECONDS = 30
+MEMORY_LIMIT_MB = 512
+POOL_SIZE = 2
+KILL_GRACE = 1.0
+READ_SIZE = 4096
+
+# --- worker side: runs in a separate interpreter started with --worker ---
+
+class CPULimitExceeded(Exception):
+    pass
+
+def on_cpu_limit(signum, frame):
+    raise CPULimitExceeded()
+
+class ProtocolStream:
+    # Replaces sys.stdout / sys.stderr in the worker; every write is sent to the parent right away
+    def __init__(self, channel, lock, name):
+        self.channel = channel
+        self.lock = lock
+        self.name = name
+
+    def write(self, text):
+        if text:
+            send(self.channel, self.lock, {"type": "output", "stream": self.name, "text": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+def send(channel, lock, message):
+    with lock:
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+def set_cpu_limit(seconds):
+    # The soft limit is raised again before every run, so a worker survives a snippet that hit it
+    import resource
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    limit = int(used.ru_utime + used.ru_stime) + seconds + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+def set_memory_limit(megabytes):
+    import resource
+    limit = megabytes * 1024 * 1024
+    hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def run_job(job, stdout, stderr):
+    namespace = {"__name__": "__main__"}
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        if job.get("cpu_seconds"):
+            set_cpu_limit(job["cpu_seconds"])
+        exec(compile(job["code"], "<kod>", "exec"), namespace)
+        output = namespace.get("output")
+        return {"status": "ok", "output": None if output is None else str(output)}
+    except KeyboardInterrupt:
+        return {"status": "cancelled"}
+    except CPULimitExceeded:
+        return {"status": "cpu_limit"}
+    except MemoryError:
+        return {"status": "memory_limit"}
+    except BaseException as e:
+        return {"status": "error", "error": f"{type(e).__name__}: {e}",
+                "traceback": "".join(traceback.format_exception(type(e), e, e.__traceback__)[1:])}
+    finally:
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+
+def worker_main(memory_mb):
+    # The protocol keeps the original stdout; fd 1 is pointed at stderr so output written
+    # below Python (C extensions, child processes) still reaches the parent as plain text
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.__stdout__ = sys.__stderr__
+    lock = threading.Lock()
+    stdout = ProtocolStream(channel, lock, "stdout")
+    stderr = ProtocolStream(channel, lock, "stderr")
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, on_cpu_limit)
+    if memory_mb:
+        set_memory_limit(memory_mb)
+    send(channel, lock, {"type": "ready"})
+    while True:
+        try:
+            line = sys.stdin.readline()
+        except KeyboardInterrupt:
+            # A cancel that arrived after the run had already finished
+            continue
+        if not line:
+            return
+        try:
+            result = run_job(json.loads(line), stdout, stderr)
+        except KeyboardInterrupt:
+            result = {"status": "cancelled"}
+        result["type"] = "done"
+        send(channel, lock, result)
+
+# --- parent side ---
+
+class CodeWorker:
+    # One long-lived interpreter; reused across runs until it dies or has to be killed
+    def __init__(self, memory_mb=MEMORY_LIMIT_MB):
+        self.process = subprocess.Popen([sys.executable, "-u", os.path.abspath(__file__), "--worker",
+                                         str(memory_mb or 0)],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        start_new_session=True)
+        self.on_output = None
+        self.stderr_thread = threading.Thread(target=self.forward_stderr, daemon=True)
+        self.stderr_thread.start()
+        self.ready = self.read_message()
+
+    def forward_stderr(self):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            data = os.read(self.process.stderr.fileno(), READ_SIZE)
+            if not data:
+                return
+            text = decoder.decode(data)
+            if text and self.on_output is not None:
+                self.on_output("stderr", text)
+
+    def read_message(self):
+        line = self.process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def alive(self):
+        return self.ready is not None and self.process.poll() is None
+
+    def execute(self, code, cpu_seconds, on_output):
+        # Blocking; returns the final message, or None when the worker died during the run
+        self.on_output = on_output
+        try:
+            self.process.stdin.write((json.dumps({"code": code, "cpu_seconds": cpu_seconds}) + "\n").encode())
+            self.process.stdin.flush()
+            while True:
+                message = self.read_message()
+                if message is None or message["type"] == "done":
+                    return message
+                on_output(message["stream"], message["text"])
+        except (OSError, ValueError):
+            return None
+        finally:
+            self.on_output = None
+
+    def interrupt(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+class CodeRun:
+    # A single snippet execution; cancel() interrupts it and kills the worker if it does not stop in time
+    def __init__(self, runner, code, on_output, on_finished):
+        self.runner = runner
+        self.code = code
+        self.on_output = on_output
+        self.on_finished = on_finished
+        self.worker = None
+        self.reason = None
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        with self.runner.slots:
+            try:
+                worker = self.runner.acquire()
+            except OSError as e:
+                self.on_finished({"status": "error", "error": str(e)})
+                return
+            with self.lock:
+                self.worker = worker
+                cancelled = self.reason is not None
+            if cancelled:
+                self.runner.release(worker)
+                self.on_finished({"status": self.reason})
+                return
+            timer = threading.Timer(self.runner.wall_seconds, self.cancel, args=("timeout",))
+            timer.daemon = True
+            timer.start()
+            result = worker.execute(self.code, self.runner.cpu_seconds, self.on_output)
+            timer.cancel()
+            with self.lock:
+                self.worker = None
+            if result is None:
+                worker.kill()
+                result = {"status": self.reason or "crashed", "returncode": worker.process.returncode}
+            elif self.reason == "timeout":
+                result["status"] = "timeout"
+            self.runner.release(worker)
+        self.on_finished(result)
+
+    def cancel(self, reason="cancelled"):
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+            worker = self.worker
+        if worker is None:
+            return
+        worker.interrupt()
+        # Code that swallows KeyboardInterrupt or sits in a C call gets the process killed instead
+        killer = threading.Timer(KILL_GRACE, self.kill_if_running, args=(worker,))
+        killer.daemon = True
+        killer.start()
+
+    def kill_if_running(self, worker):
+        with self.lock:
+            running = self.worker is worker
+        if running:
+            worker.kill()
+
+class CodeRunner:
+    # Pool of reusable worker interpreters with per-run CPU, wall-clock and memory limits
+    def __init__(self, pool_size=POOL_SIZE, cpu_seconds=CPU_SECONDS, wall_seconds=WALL_SECONDS,
+                 memory_mb=MEMORY_LIMIT_MB):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.slots = threading.Semaphore(pool_size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.closed = False
+
+    def acquire(self):
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive():
+                    return worker
+        return CodeWorker(self.memory_mb)
+
+    def release(self, worker):
+        with self.lock:
+            if worker.alive() and not self.closed:
+                self.idle.append(worker)
+                return
+        worker.kill()
+
+    def warm_up(self):
+        # Starts one interpreter in the background so the first run skips the startup cost
+        def start():
+            try:
+                self.release(CodeWorker(self.memory_mb))
+            except OSError as e:
+                print(f"Error starting code worker: {e}")
+        threading.Thread(target=start, daemon=True).start()
+
+    def run(self, code, on_output, on_finished):
+        # on_output(stream, text) and on_finished(result) are called from worker threads
+        code_run = CodeRun(self, code, on_output, on_finished)
+        code_run.thread.start()
+        return code_run
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            workers, self.idle = self.idle, []
+        for worker in workers:
+            worker.kill()
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] == "--worker":
+    worker_main(int(sys.argv[2]) if len(sys.argv) > 2 else MEMORY_LIMIT_MB)
@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+
+DEFAULT_CONTEXT_TOKENS = 4096
+MAX_CONTEXT_TOKENS = 8192
+RESPONSE_RESERVE_TOKENS = 512
+MESSAGE_OVERHEAD_TOKENS = 4
+CHARS_PER_TOKEN = 4.0
+
+SUMMARY_PROMPT = ("Streść zwięźle poniższą wcześniejszą część rozmowy, zachowując fakty, ustalenia i pytania "
+                  "bez odpowiedzi. Odpowiedz samym streszczeniem.")
+
+def context_length_from_show(show_response):
+    # Accepts both the dict and the typed response of ollama's show()
+    info = show_response.get("modelinfo") or show_response.get("model_info") or {}
+    for key, value in info.items():
+        if key.endswith(".context_length"):
+            return int(value)
+    return None
+
+class ConversationContext:
+    # Conversation history with a running token estimate per message, trimmed to a token budget
+    def __init__(self, budget=DEFAULT_CONTEXT_TOKENS, reserve=RESPONSE_RESERVE_TOKENS):
+        self.budget = budget
+        self.reserve = reserve
+        self.chars_per_token = CHARS_PER_TOKEN
+        self.lock = threading.Lock()
+        self.messages = deque()
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.evicted = []
+
+    def estimate_tokens(self, text):
+        return int(len(text) / self.chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, role, content):
+        tokens = self.estimate_tokens(content)
+        with self.lock:
+            self.messages.append(({'role': role, 'content': content}, tokens))
+            self.total_tokens += tokens
+
+    def clear(self):
+        with self.lock:
+            self.messages.clear()
+            self.total_tokens = 0
+            self.summary = ""
+            self.summary_tokens = 0
+            self.evicted = []
+
+    def load(self, messages):
+        self.clear()
+        for message in messages:
+            self.append(message['role'], message['content'])
+
+    def history(self):
+        with self.lock:
+            return [message for message, tokens in self.messages]
+
+    def set_budget(self, budget):
+        self.budget = budget
+
+    def trim(self, keep_evicted=False):
+        # The newest message always stays, even if it alone is over budget
+        limit = max(self.budget - self.reserve, 0)
+        with self.lock:
+            while len(self.messages) > 1 and self.total_tokens + self.summary_tokens > limit:
+                message, tokens = self.messages.popleft()
+                self.total_tokens -= tokens
+                if keep_evicted:
+                    self.evicted.append(message)
+
+    def request_messages(self):
+        with self.lock:
+            messages = [message for message, tokens in self.messages]
+            if self.summary:
+                messages.insert(0, {'role': 'system', 'content': f"Wcześniejsza część rozmowy: {self.summary}"})
+            return messages, self.total_tokens + self.summary_tokens
+
+    def calibrate(self, estimated_tokens, actual_tokens):
+        # Moves the chars-per-token ratio towards what the server actually counted
+        if not estimated_tokens or not actual_tokens or actual_tokens < estimated_tokens / 2:
+            # Missing or partial counts (e.g. the server reused its prompt cache) say nothing about the ratio
+            return
+        with self.lock:
+            observed = self.chars_per_token * estimated_tokens / actual_tokens
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+
+    def take_evicted(self):
+        with self.lock:
+            evicted, self.evicted = self.evicted, []
+            return evicted
+
+    def summary_request(self, evicted):
+        lines = [f"{message['role']}: {message['content']}" for message in evicted]
+        if self.summary:
+            lines.insert(0, f"Dotychczasowe streszczenie: {self.summary}")
+        return [{'role': 'system', 'content': SUMMARY_PROMPT}, {'role': 'user', 'content': "\n".join(lines)}]
+
+    def set_summary(self, summary):
+        with self.lock:
+            self.summary = summary.strip()
+            self.summary_tokens = self.estimate_tokens(self.summary) if self.summary else 0
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "chatbotapp")
+STORE_PATH = os.path.join(DATA_DIR, "conversations.sqlite3")
+PAGE_SIZE = 50
+TITLE_LENGTH = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id),
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (conversation_id, seq)
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated);
+"""
+
+# The full-text index is an external-content FTS5 table kept up to date by a trigger,
+# so every appended message is indexed in the same transaction that stores it
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+SEARCH_LIMIT = 100
+JUMP_CONTEXT = 5
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+def fts_query(text):
+    # Every word becomes a quoted prefix term, so user input cannot break the FTS5 query syntax
+    words = [word.replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words)
+
+class ConversationStore:
+    # Append-only SQLite store. Every query runs on one worker thread that owns the connection,
+    # so callers get futures back and never block the GTK main loop on disk I/O.
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-store",
+                                           initializer=self._connect)
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        has_index = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+        self.connection.executescript(SEARCH_SCHEMA)
+        if not has_index:
+            # Databases created before the index existed are indexed once
+            self.connection.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        self.connection.commit()
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, *args)
+
+    def append_message(self, conversation_id, role, content, model=""):
+        return self.submit(self._append_message, conversation_id, role, content, model)
+
+    def _append_message(self, conversation_id, role, content, model):
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO conversations (id, model, created, updated) VALUES (?, ?, ?, ?)",
+                (conversation_id, model, now, now))
+            seq = self.connection.execute("SELECT message_count FROM conversations WHERE id = ?",
+                                          (conversation_id,)).fetchone()[0]
+            cursor = self.connection.execute(
+                "INSERT INTO messages (conversation_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, seq, role, content, now))
+            title = content.strip().splitlines()[0][:TITLE_LENGTH] if role == 'user' and content.strip() else ""
+            self.connection.execute(
+                "UPDATE conversations SET message_count = message_count + 1, updated = ?, "
+                "title = CASE WHEN title = '' THEN ? ELSE title END, "
+                "model = CASE WHEN ? != '' THEN ? ELSE model END WHERE id = ?",
+                (now, title, model, model, conversation_id))
+        return seq, cursor.lastrowid
+
+    def load_page(self, conversation_id, before_seq=None, limit=PAGE_SIZE):
+        return self.submit(self._load_page, conversation_id, before_seq, limit)
+
+    def _load_page(self, conversation_id, before_seq, limit):
+        if before_seq is None:
+            before_seq = self.connection.execute("SELECT message_count FROM conversations WHERE id = ?",
+                                                 (conversation_id,)).fetchone()
+            before_seq = before_seq[0] if before_seq else 0
+        rows = self.connection.execute(
+            "SELECT seq, role, content FROM messages WHERE conversation_id = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?", (conversation_id, before_seq, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def load_from(self, conversation_id, seq, context=JUMP_CONTEXT, limit=PAGE_SIZE):
+        return self.submit(self._load_after, conversation_id, seq - context - 1, limit)
+
+    def load_after(self, conversation_id, after_seq, limit=PAGE_SIZE):
+        return self.submit(self._load_after, conversation_id, after_seq, limit)
+
+    def _load_after(self, conversation_id, after_seq, limit):
+        return self.connection.execute(
+            "SELECT seq, role, content FROM messages WHERE conversation_id = ? AND seq > ? "
+            "ORDER BY seq LIMIT ?", (conversation_id, after_seq, limit)).fetchall()
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        return self.submit(self._search, text, limit)
+
+    def _search(self, text, limit):
+        query = fts_query(text)
+        if not query:
+            return []
+        return self.connection.execute(
+            "SELECT m.conversation_id, m.seq, c.title, "
+            "snippet(messages_fts, 0, '»', '«', '…', 12) "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+
+    def list_conversations(self, limit=200):
+        return self.submit(self._list_conversations, limit)
+
+    def _list_conversations(self, limit):
+        return self.connection.execute(
+            "SELECT id, title, model, created, updated, message_count FROM conversations "
+            "ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+
+    def export_json(self, conversation_id, path):
+        return self.submit(self._export_json, conversation_id, path)
+
+    def _export_json(self, conversation_id, path):
+        # Streams rows into the file instead of building the whole document in memory
+        cursor = self.connection.execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,))
+        with open(path, 'w') as file:
+            file.write("[")
+            for index, (role, content) in enumerate(cursor):
+                if index:
+                    file.write(", ")
+                file.write(json.dumps({'role': role, 'content': content}))
+            file.write("]")
+
+    def import_json(self, path):
+        return self.submit(self._import_json, path)
+
+    def _import_json(self, path):
+        with open(path) as file:
+            messages = json.load(file)
+        conversation_id = new_conversation_id()
+        for message in messages:
+            self._append_message(conversation_id, message['role'], message['content'], "")
+        return conversation_id
+
+    def close(self):
+        def close_connection():
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+        self.executor.submit(close_connection)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,272 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHUNK_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 0.25
+
+class DownloadCancelled(Exception):
+    pass
+
+class ChecksumMismatch(Exception):
+    pass
+
+class DownloadJob:
+    def __init__(self, filename, url, size=None, sha256=None):
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.sha256 = sha256
+
+class FileProgress:
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+        self.done = 0
+        self.resumed = 0
+        self.started = None
+        self.finished = None
+
+    def rate(self):
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return (self.done - self.resumed) / elapsed if elapsed > 0 else 0.0
+
+def parse_repo_id(model_url):
+    path = urllib.parse.urlparse(model_url).path if "://" in model_url else model_url
+    parts = [part for part in path.strip("/").split("/") if part]
+    return "/".join(parts[:2])
+
+def hub_token():
+    # Token saved by `huggingface-cli login` or set in HF_TOKEN; needed for gated and private repos
+    from huggingface_hub import get_token
+    return get_token()
+
+def plan_hub_download(repo_id, revision="main", endpoint=None, token=None):
+    from huggingface_hub import HfApi, hf_hub_url
+
+    info = HfApi(endpoint=endpoint, token=token).model_info(repo_id, revision=revision, files_metadata=True)
+    jobs = []
+    for sibling in info.siblings:
+        lfs = sibling.lfs
+        sha256 = None
+        if lfs is not None:
+            sha256 = lfs["sha256"] if isinstance(lfs, dict) else lfs.sha256
+        url = hf_hub_url(repo_id, sibling.rfilename, revision=revision, endpoint=endpoint)
+        jobs.append(DownloadJob(sibling.rfilename, url, sibling.size, sha256))
+    return jobs
+
+def plan_url_download(base_url, filenames):
+    # Plain HTTP source, e.g. a local file server standing in for the Hub
+    base_url = base_url.rstrip("/") + "/"
+    return [DownloadJob(name, urllib.parse.urljoin(base_url, urllib.parse.quote(name))) for name in filenames]
+
+class DownloadManager:
+    # Fetches files concurrently into target_dir, resuming from .part files and verifying sha256 where known
+    def __init__(self, target_dir, jobs, max_workers=4, token=None, retries=3,
+                 on_progress=None, on_file_done=None):
+        self.target_dir = target_dir
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.token = token
+        self.retries = retries
+        self.on_progress = on_progress
+        self.on_file_done = on_file_done
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.progress = {job.filename: FileProgress(job.filename, job.size) for job in jobs}
+        self.started = None
+        self.last_report = 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def total_done(self):
+        return sum(progress.done for progress in self.progress.values())
+
+    def total_size(self):
+        sizes = [progress.size for progress in self.progress.values()]
+        return None if None in sizes else sum(sizes)
+
+    def total_rate(self):
+        if self.started is None:
+            return 0.0
+        resumed = sum(progress.resumed for progress in self.progress.values())
+        elapsed = time.perf_counter() - self.started
+        return (self.total_done() - resumed) / elapsed if elapsed > 0 else 0.0
+
+    def run(self):
+        self.started = time.perf_counter()
+        os.makedirs(self.target_dir, exist_ok=True)
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download_with_retries, job): job for job in self.jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                except DownloadCancelled:
+                    errors[job.filename] = "cancelled"
+                except Exception as e:
+                    errors[job.filename] = str(e)
+                if self.on_file_done:
+                    self.on_file_done(job.filename, errors.get(job.filename))
+        self.report(force=True)
+        return errors
+
+    def download_with_retries(self, job):
+        for attempt in range(self.retries):
+            try:
+                return self.download(job)
+            except urllib.error.HTTPError as e:
+                # Client errors such as 401 or 404 come back the same on every attempt
+                if 400 <= e.code < 500 and e.code not in (408, 429):
+                    raise
+                if attempt == self.retries - 1 or self.cancel_event.is_set():
+                    raise
+                time.sleep(2 ** attempt)
+            except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+                if attempt == self.retries - 1 or self.cancel_event.is_set():
+                    raise
+                time.sleep(2 ** attempt)
+            except ChecksumMismatch:
+                # A corrupt partial file cannot be resumed, so the next attempt starts from scratch
+                if attempt == self.retries - 1:
+                    raise
+
+    def download(self, job):
+        path = os.path.join(self.target_dir, job.filename)
+        part_path = path + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        progress = self.progress[job.filename]
+
+        if os.path.exists(path) and (job.size is None or os.path.getsize(path) == job.size):
+            if job.sha256 is None or file_sha256(path) == job.sha256:
+                progress.done = progress.resumed = os.path.getsize(path)
+                progress.size = progress.done
+                self.report()
+                return path
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if job.size is not None and offset > job.size:
+            # Left over from an older version of the file; it can never be completed
+            os.remove(part_path)
+            offset = 0
+        request = urllib.request.Request(job.url)
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # The partial file already holds the whole body
+            response = None
+
+        digest = hashlib.sha256()
+        if response is None:
+            append = True
+        else:
+            append = offset > 0 and response.status == 206
+            if progress.size is None:
+                length = response.headers.get("Content-Length")
+                if length is not None:
+                    progress.size = int(length) + (offset if append else 0)
+        if append and offset:
+            hash_file(part_path, digest)
+        else:
+            offset = 0
+        progress.done = progress.resumed = offset
+        progress.started = time.perf_counter()
+
+        if response is not None:
+            with response, open(part_path, "ab" if append else "wb") as file:
+                while True:
+                    if self.cancel_event.is_set():
+                        raise DownloadCancelled(job.filename)
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+                    digest.update(chunk)
+                    progress.done += len(chunk)
+                    self.report()
+        progress.finished = time.perf_counter()
+
+        if job.size is not None and progress.done != job.size:
+            raise ConnectionError(f"{job.filename}: got {progress.done} of {job.size} bytes")
+        if job.sha256 is not None and digest.hexdigest() != job.sha256:
+            os.remove(part_path)
+            raise ChecksumMismatch(f"{job.filename}: sha256 mismatch")
+        os.replace(part_path, path)
+        progress.size = progress.done
+        self.report()
+        return path
+
+    def report(self, force=False):
+        if not self.on_progress:
+            return
+        with self.lock:
+            now = time.perf_counter()
+            if not force and now - self.last_report < PROGRESS_INTERVAL:
+                return
+            self.last_report = now
+        self.on_progress(self)
+
+def hash_file(path, digest):
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def file_sha256(path):
+    return hash_file(path, hashlib.sha256()).hexdigest()
+
+def format_rate(bytes_per_second):
+    return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+
+def print_progress(manager):
+    total = manager.total_size()
+    total_text = f"{manager.total_done() / (1024 * 1024):.1f}"
+    if total:
+        total_text += f" / {total / (1024 * 1024):.1f}"
+    sys.stdout.write(f"\r{total_text} MB, {format_rate(manager.total_rate())}   ")
+    sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a model with resumable parallel transfers")
+    parser.add_argument("repo_id", help="Hugging Face repo id or model URL")
+    parser.add_argument("target_dir")
+    parser.add_argument("--endpoint", help="Hub endpoint, e.g. a local mirror")
+    parser.add_argument("--base-url", help="Fetch --files from a plain HTTP server instead of the Hub")
+    parser.add_argument("--files", default="", help="Comma separated file names for --base-url")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    token = None
+    if args.base_url:
+        jobs = plan_url_download(args.base_url, [name for name in args.files.split(",") if name])
+    else:
+        token = hub_token()
+        jobs = plan_hub_download(parse_repo_id(args.repo_id), endpoint=args.endpoint, token=token)
+    manager = DownloadManager(args.target_dir, jobs, max_workers=args.workers, token=token,
+                              on_progress=print_progress)
+    errors = manager.run()
+    print()
+    for filename, error in errors.items():
+        print(f"{filename}: {error}")
+    sys.exit(1 if errors else 0)
+
+if __name__ == '__main__':
+    main()
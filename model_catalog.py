@@ -0,0 +1,89 @@
+import os
+import json
+import time
+
+import requests
+
+CATALOG_URL = os.environ.get("OLLAMA_CATALOG_URL", "https://ollama-models.zwz.workers.dev/")
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "chatbotapp")
+CATALOG_TTL = 24 * 60 * 60
+REQUEST_TIMEOUT = 10
+
+class ModelCatalog:
+    # Remote model catalog cached on disk, revalidated with ETag / If-Modified-Since once the TTL has passed
+    def __init__(self, url=CATALOG_URL, cache_dir=CACHE_DIR, ttl=CATALOG_TTL):
+        self.url = url
+        self.cache_path = os.path.join(cache_dir, "catalog.json")
+        self.ttl = ttl
+        self.data = self.load_cached()
+
+    def load_cached(self):
+        try:
+            with open(self.cache_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"fetched_at": 0, "etag": None, "last_modified": None, "models": {}}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.data, file)
+        os.replace(temp_path, self.cache_path)
+
+    @property
+    def models(self):
+        return self.data["models"]
+
+    def is_fresh(self):
+        return time.time() - self.data["fetched_at"] < self.ttl
+
+    def refresh(self, force=False):
+        # Blocking; returns True when the catalog contents changed
+        if self.is_fresh() and not force:
+            return False
+        headers = {}
+        if self.data.get("etag"):
+            headers["If-None-Match"] = self.data["etag"]
+        if self.data.get("last_modified"):
+            headers["If-Modified-Since"] = self.data["last_modified"]
+
+        response = requests.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            self.data["fetched_at"] = time.time()
+            self.save()
+            return False
+        response.raise_for_status()
+
+        models = {model["name"]: model["tags"] for model in response.json().get("models", [])}
+        changed = models != self.data["models"]
+        self.data = {
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "models": models,
+        }
+        self.save()
+        return changed
+
+def split_model_name(name):
+    model, _, tag = name.partition(":")
+    return model, tag or "latest"
+
+def local_models(list_response):
+    # Accepts both the dict and the typed response of ollama's list()
+    installed = {}
+    for entry in list_response["models"]:
+        name = entry.get("model") or entry.get("name")
+        model, tag = split_model_name(name)
+        installed.setdefault(model, []).append(tag)
+    return installed
+
+def merge_catalog(remote, installed):
+    merged = {model: list(tags) for model, tags in remote.items()}
+    for model, tags in installed.items():
+        merged_tags = merged.setdefault(model, [])
+        for tag in tags:
+            if tag not in merged_tags:
+                merged_tags.append(tag)
+    return merged
@@ -0,0 +1,103 @@
+import time
+import threading
+
+SMOOTHING = 0.3
+DEFAULT_TTFT = 1.0
+DEFAULT_TOKENS_PER_SECOND = 20.0
+COLD_LOAD_PENALTY = 5.0
+EXPECTED_RESPONSE_TOKENS = 200
+MAX_ERROR_RATE = 0.5
+# Errors are forgotten over time, so a model excluded after an outage is tried again later
+ERROR_HALF_LIFE = 60.0
+RESPONSE_RESERVE_TOKENS = 512
+
+def smooth(current, value):
+    if current is None:
+        return value
+    return (1 - SMOOTHING) * current + SMOOTHING * value
+
+def loaded_model_names(ps_response):
+    # Accepts both the dict and the typed response of ollama's ps()
+    names = set()
+    for entry in ps_response["models"]:
+        name = entry.get("model") or entry.get("name")
+        names.add(name)
+        if ":" not in name:
+            names.add(f"{name}:latest")
+    return names
+
+class ModelStats:
+    def __init__(self):
+        self.warm_ttft = None
+        self.cold_ttft = None
+        self.tokens_per_second = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.last_used = 0.0
+
+    def current_error_rate(self, now=None):
+        elapsed = (now or time.time()) - self.last_used
+        return self.error_rate * 0.5 ** (max(elapsed, 0.0) / ERROR_HALF_LIFE)
+
+class ModelRouter:
+    # Rolling per-model latency statistics used to pick the fastest model that fits the prompt
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.loaded = set()
+
+    def model_stats(self, model):
+        return self.stats.setdefault(model, ModelStats())
+
+    def set_loaded(self, names):
+        with self.lock:
+            self.loaded = set(names)
+
+    def is_loaded(self, model):
+        return model in self.loaded or f"{model}:latest" in self.loaded
+
+    def record(self, model, ttft=None, tokens_per_second=None, error=False, was_loaded=None):
+        with self.lock:
+            stats = self.model_stats(model)
+            now = time.time()
+            stats.error_rate = smooth(stats.current_error_rate(now), 1.0 if error else 0.0)
+            stats.requests += 1
+            stats.last_used = now
+            if error:
+                return
+            if ttft is not None:
+                if was_loaded is False:
+                    stats.cold_ttft = smooth(stats.cold_ttft, ttft)
+                else:
+                    stats.warm_ttft = smooth(stats.warm_ttft, ttft)
+            if tokens_per_second:
+                stats.tokens_per_second = smooth(stats.tokens_per_second, tokens_per_second)
+
+    def expected_latency(self, model, response_tokens=EXPECTED_RESPONSE_TOKENS):
+        stats = self.stats.get(model) or ModelStats()
+        ttft = stats.warm_ttft if stats.warm_ttft is not None else DEFAULT_TTFT
+        if not self.is_loaded(model):
+            ttft = stats.cold_ttft if stats.cold_ttft is not None else ttft + COLD_LOAD_PENALTY
+        tokens_per_second = stats.tokens_per_second or DEFAULT_TOKENS_PER_SECOND
+        return ttft + response_tokens / tokens_per_second
+
+    def choose(self, candidates, prompt_tokens, context_limits):
+        # Models whose context cannot hold the prompt are skipped, as are models that keep failing
+        with self.lock:
+            needed = prompt_tokens + RESPONSE_RESERVE_TOKENS
+            eligible = [model for model in candidates
+                        if context_limits.get(model, needed) >= needed
+                        and (self.stats.get(model) or ModelStats()).current_error_rate() <= MAX_ERROR_RATE]
+            if not eligible:
+                return max(candidates, key=lambda model: context_limits.get(model, 0))
+            return min(eligible, key=self.expected_latency)
+
+    def summary(self, model):
+        stats = self.stats.get(model)
+        if stats is None:
+            return f"{model}: brak pomiarów"
+        ttft = f"{stats.warm_ttft:.2f} s" if stats.warm_ttft is not None else "-"
+        tokens_per_second = f"{stats.tokens_per_second:.1f}" if stats.tokens_per_second else "-"
+        state = "załadowany" if self.is_loaded(model) else "niezaładowany"
+        return (f"{model}: pierwszy token {ttft}, {tokens_per_second} tok/s, "
+                f"błędy {stats.current_error_rate():.0%}, {state}")
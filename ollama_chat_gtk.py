@@ -1,9 +1,10 @@
 import gi
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk
 
 import asyncio
-from ollama import AsyncClient
+from ollama_pool import PooledOllamaClient
+from stream_renderer import StreamRenderer
 import threading
 
 class ChatWindow(Gtk.Window):
@@ -16,6 +17,7 @@ class ChatWindow(Gtk.Window):
         self.chat_view.set_editable(False)
         self.chat_view.set_wrap_mode(Gtk.WrapMode.WORD)
         self.chat_buffer = self.chat_view.get_buffer()
+        self.renderer = StreamRenderer(self.chat_buffer)
 
         self.input_view = Gtk.TextView()
         self.input_view.set_wrap_mode(Gtk.WrapMode.WORD)
@@ -45,6 +47,14 @@ spacing=6)
 daemon=True)
         self.loop_thread.start()
 
+        # Jeden klient z pulą połączeń na okno, używany wyłącznie z pętli asyncio
+        self.ollama = PooledOllamaClient()
+        self.connect("destroy", self.on_destroy)
+
+    def on_destroy(self, widget):
+        future = asyncio.run_coroutine_threadsafe(self.ollama.aclose(), self.loop)
+        future.result(timeout=5)
+
     def start_loop(self):
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
@@ -56,17 +66,17 @@ daemon=True)
 True)
         self.input_buffer.set_text("")
 
-        self.chat_buffer.insert_at_cursor(f"Użytkownik: {user_message}\n")
+        self.renderer.write(f"Użytkownik: {user_message}\n")
         asyncio.run_coroutine_threadsafe(self.get_response(user_message), 
 self.loop)
 
     async def get_response(self, user_message):
         message = {'role': 'user', 'content': user_message}
-        async for part in await AsyncClient().chat(model='llama3', 
-messages=[message], stream=True):
+        async for part in self.ollama.chat_stream(model='llama3', 
+messages=[message]):
             content = part['message']['content']
-            GLib.idle_add(self.chat_buffer.insert_at_cursor, content)
-        GLib.idle_add(self.chat_buffer.insert_at_cursor, "\n")
+            self.renderer.write(content)
+        self.renderer.write("\n")
 
 window = ChatWindow()
 window.connect("destroy", Gtk.main_quit)
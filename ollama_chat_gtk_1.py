@@ -3,23 +3,139 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GLib, Pango
 
 import asyncio
-from ollama import AsyncClient
+from ollama_pool import PooledOllamaClient
+from stream_renderer import StreamRenderer
 import threading
 import gc
-import json
+import os
+import time
 import subprocess
-import requests
+from model_catalog import ModelCatalog, local_models, merge_catalog
+from conversation_store import PAGE_SIZE, ConversationStore, new_conversation_id
+from model_router import ModelRouter, loaded_model_names
+from response_cache import ResponseCache
+from code_runner import CodeRunner
+from pull_queue import PullQueue, format_bytes, QUEUED, RUNNING, PAUSED, DONE, FAILED, CANCELLED
+from telemetry import from_environment as telemetry_from_environment
+from context_manager import ConversationContext, context_length_from_show, DEFAULT_CONTEXT_TOKENS, MAX_CONTEXT_TOKENS
+
+# Tani model do streszczania starszych wiadomości; pusty oznacza użycie bieżącego modelu
+SUMMARY_MODEL = os.environ.get("OLLAMA_SUMMARY_MODEL", "")
+RESPONSE_IMPORT = 1
+FANOUT_CONCURRENCY = 3
+# Jak długo Ollama ma trzymać w pamięci model wybrany przez auto-wybór
+KEEP_ALIVE = "30m"
+
+def format_message(role, content):
+    if role == 'user':
+        return f"Użytkownik: {content}\n"
+    return f"{content}\n"
+
+class ComparisonWindow(Gtk.Window):
+    # Osobny panel z odpowiedzią dla każdego porównywanego modelu
+    def __init__(self, parent, models):
+        super().__init__(title="Porównanie modeli", transient_for=parent)
+        self.set_default_size(300 * len(models), 500)
+        self.renderers = {}
+
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.add(vbox)
+        panes = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6, homogeneous=True)
+        vbox.pack_start(panes, True, True, 0)
+
+        for model in models:
+            view = Gtk.TextView()
+            view.set_editable(False)
+            view.set_wrap_mode(Gtk.WrapMode.WORD)
+            self.renderers[model] = StreamRenderer(view.get_buffer())
+            scroll = Gtk.ScrolledWindow()
+            scroll.add(view)
+            frame = Gtk.Frame(label=model)
+            frame.add(scroll)
+            panes.pack_start(frame, True, True, 0)
+
+        self.summary_label = Gtk.Label(label="Generowanie...")
+        self.summary_label.set_xalign(0)
+        self.summary_label.set_selectable(True)
+        vbox.pack_start(self.summary_label, False, False, 0)
+
+    def show_summary(self, summary):
+        self.summary_label.set_text(summary)
+        return False
+
+def format_seconds(value):
+    return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+def format_stats_overlay(timer, snapshot):
+    lines = []
+    if timer.error is None:
+        tokens_per_second = f"{timer.tokens_per_second:.1f}" if timer.tokens_per_second else "-"
+        prompt_tokens = timer.prompt_tokens if timer.prompt_tokens is not None else "?"
+        lines.append(f"Ostatnie ({timer.model}): TTFT {format_seconds(timer.ttft)}, {tokens_per_second} tok/s, "
+                     f"kolejka {format_seconds(timer.queue_wait)}, tokeny {prompt_tokens} + {timer.completion_tokens}")
+    else:
+        lines.append(f"Ostatnie ({timer.model}): błąd")
+    for model, stats in snapshot.items():
+        lines.append(f"{model}: {stats['requests']} zapytań, TTFT p50 ≤ {format_seconds(stats['ttft_p50'])}, "
+                     f"odstęp p95 ≤ {format_seconds(stats['inter_token_p95'])}")
+    return "\n".join(lines)
+
+def format_fan_out_summary(results):
+    lines = []
+    for result in sorted(results, key=lambda result: result['total'] if result['error'] is None else float('inf')):
+        if result['error'] is not None:
+            lines.append(f"{result['model']}: błąd - {result['error']}")
+            continue
+        ttft = f"{result['ttft']:.2f} s" if result['ttft'] is not None else "-"
+        tokens_per_second = f"{result['tokens_per_second']:.1f}" if result['tokens_per_second'] else "-"
+        lines.append(f"{result['model']}: pierwszy token {ttft}, {tokens_per_second} tok/s, "
+                     f"całość {result['total']:.2f} s")
+    return "\n".join(lines)
 
 class ChatWindow(Gtk.Window):
     def __init__(self):
         super().__init__(title="Zaawansowana Aplikacja Czatu")
         self.set_default_size(800, 600)
 
-        self.available_models = []
-        self.model_tags = {}
-        self.fetch_models_and_tags()
-
-        self.conversation_history = []
+        # Okno budowane jest od razu z katalogu w pamięci podręcznej, odświeżanie odbywa się w tle
+        self.catalog = ModelCatalog()
+        self.installed_models = {}
+        self.available_models = list(self.catalog.models)
+        self.model_tags = dict(self.catalog.models)
+
+        self.conversation_history = ConversationContext()
+        self.context_limits = {}
+
+        # Każda wiadomość trafia do bazy po zakończeniu; starsze strony są doczytywane przy przewijaniu w górę
+        self.store = ConversationStore()
+        self.conversation_id = new_conversation_id()
+        self.oldest_loaded_seq = None
+        self.newest_loaded_seq = None
+        self.stored_end_seq = None
+        self.loading_page = False
+        self.search_generation = 0
+
+        self.router = ModelRouter()
+        self.auto_select_enabled = True
+
+        # Pomiary każdego żądania; eksport przez CHAT_METRICS_FILE lub CHAT_METRICS_PORT
+        self.telemetry = telemetry_from_environment("ollama_chat_gtk_1")
+
+        # Odpowiedzi na identyczne zapytania (model, opcje, historia) odtwarzane z pamięci, domyślnie wyłączone
+        self.response_cache = ResponseCache()
+        self.cache_enabled = False
+
+        # Kod Python wykonywany w osobnych, wielokrotnie używanych procesach z limitami CPU, czasu i pamięci
+        self.code_runner = CodeRunner()
+        self.code_runner.warm_up()
+        self.code_run = None
+
+        # Kolejka `ollama pull` z limitem równoległych pobrań, odtwarzana po ponownym uruchomieniu
+        self.pull_queue = PullQueue(on_update=lambda job: GLib.idle_add(self.update_pull_row, job),
+                                    on_finished=lambda job: GLib.idle_add(self.on_pull_finished, job))
+        self.pull_rows = {}
+        # Wiersze przywróconych pobrań dodawane są przez idle_add, już po zbudowaniu okna
+        self.pull_queue.restore()
         self.temperature = 0.7
 
         # Tworzenie pól tekstowych
@@ -27,6 +143,12 @@ class ChatWindow(Gtk.Window):
         self.chat_view.set_editable(False)
         self.chat_view.set_wrap_mode(Gtk.WrapMode.WORD)
         self.chat_buffer = self.chat_view.get_buffer()
+        self.renderer = StreamRenderer(self.chat_buffer)
+        self.page_anchor = self.chat_buffer.create_mark(None, self.chat_buffer.get_start_iter(), False)
+        self.search_hit_mark = self.chat_buffer.create_mark(None, self.chat_buffer.get_start_iter(), True)
+        # Koniec wczytanej historii; nowsze strony trafiają tutaj, przed wiadomości z bieżącej sesji
+        self.newer_mark = self.chat_buffer.create_mark(None, self.chat_buffer.get_start_iter(), True)
+        self.search_hit_tag = self.chat_buffer.create_tag("search-hit", background="#fce94f", foreground="#000000")
 
         self.input_view = Gtk.TextView()
         self.input_view.set_wrap_mode(Gtk.WrapMode.WORD)
@@ -38,6 +160,20 @@ class ChatWindow(Gtk.Window):
 
         self.auto_select_checkbox = Gtk.CheckButton(label="Auto-wybór modelu")
         self.auto_select_checkbox.set_active(True)
+        self.auto_select_checkbox.connect("toggled", self.on_auto_select_toggled)
+
+        self.summary_checkbox = Gtk.CheckButton(label="Streszczaj starsze wiadomości")
+        self.summary_checkbox.set_active(False)
+
+        self.fan_out_checkbox = Gtk.CheckButton(label="Porównaj zaznaczone modele")
+        self.fan_out_checkbox.set_active(False)
+
+        self.cache_checkbox = Gtk.CheckButton(label="Pamięć odpowiedzi")
+        self.cache_checkbox.set_active(False)
+        self.cache_checkbox.connect("toggled", self.on_cache_toggled)
+
+        self.invalidate_cache_button = Gtk.Button.new_with_label("Unieważnij odpowiedzi")
+        self.invalidate_cache_button.connect("clicked", self.invalidate_response_cache)
 
         self.clear_memory_button = Gtk.Button.new_with_label("Wyczyść pamięć")
         self.clear_memory_button.connect("clicked", self.clear_memory)
@@ -63,14 +199,22 @@ class ChatWindow(Gtk.Window):
         self.run_code_button = Gtk.Button.new_with_label("Uruchom kod Python")
         self.run_code_button.connect("clicked", self.run_python_code)
 
+        self.cancel_code_button = Gtk.Button.new_with_label("Przerwij kod")
+        self.cancel_code_button.connect("clicked", self.cancel_python_code)
+        self.cancel_code_button.set_sensitive(False)
+
         self.download_model_button = Gtk.Button.new_with_label("Pobierz model")
         self.download_model_button.connect("clicked", self.show_download_dialog)
 
         self.serve_model_button = Gtk.Button.new_with_label("Uruchom serwer")
         self.serve_model_button.connect("clicked", self.serve_model)
 
+        self.stats_checkbox = Gtk.CheckButton(label="Statystyki")
+        self.stats_checkbox.set_active(True)
+        self.stats_checkbox.connect("toggled", self.on_stats_toggled)
+
         # Tworzenie rozwijanej listy modeli z zaznaczeniami
-        self.model_tree_store = Gtk.TreeStore(bool, str, str)  # Dodano kolumnę dla tagu
+        self.model_tree_store = Gtk.TreeStore(bool, str, str, bool)  # Dodano kolumnę dla tagu i stanu pobrania
         self.model_tree_view = Gtk.TreeView(model=self.model_tree_store)
 
         toggle_renderer = Gtk.CellRendererToggle()
@@ -86,10 +230,12 @@ class ChatWindow(Gtk.Window):
         column_tag = Gtk.TreeViewColumn("Tag", tag_renderer, text=2)
         self.model_tree_view.append_column(column_tag)
 
-        for model in self.available_models:
-            parent = self.model_tree_store.append(None, [False, model, ""])
-            for tag in self.model_tags.get(model, []):
-                self.model_tree_store.append(parent, [False, f"{model}:{tag}", tag])
+        installed_renderer = Gtk.CellRendererToggle()
+        installed_renderer.set_activatable(False)
+        column_installed = Gtk.TreeViewColumn("Pobrany", installed_renderer, active=3)
+        self.model_tree_view.append_column(column_installed)
+
+        self.update_model_tree()
 
         model_scroll = Gtk.ScrolledWindow()
         model_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
@@ -100,9 +246,25 @@ class ChatWindow(Gtk.Window):
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         self.add(vbox)
 
-        chat_scroll = Gtk.ScrolledWindow()
-        chat_scroll.add(self.chat_view)
-        vbox.pack_start(chat_scroll, True, True, 0)
+        self.chat_scroll = Gtk.ScrolledWindow()
+        self.chat_scroll.add(self.chat_view)
+        self.chat_scroll.get_vadjustment().connect("value-changed", self.on_chat_scrolled)
+        self.chat_scroll.get_vadjustment().connect("changed", self.on_chat_resized)
+
+        # Nakładka ze statystykami ostatniego żądania w rogu okna czatu
+        self.stats_overlay = Gtk.Label(label="")
+        self.stats_overlay.set_halign(Gtk.Align.END)
+        self.stats_overlay.set_valign(Gtk.Align.START)
+        self.stats_overlay.set_margin_top(6)
+        self.stats_overlay.set_margin_end(12)
+        self.stats_overlay.set_xalign(1)
+        self.stats_overlay.get_style_context().add_class("osd")
+        self.stats_overlay.set_no_show_all(True)
+        chat_overlay = Gtk.Overlay()
+        chat_overlay.add(self.chat_scroll)
+        chat_overlay.add_overlay(self.stats_overlay)
+        chat_overlay.set_overlay_pass_through(self.stats_overlay, True)
+        vbox.pack_start(chat_overlay, True, True, 0)
 
         input_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         input_box.pack_start(self.input_view, True, True, 0)
@@ -111,6 +273,10 @@ class ChatWindow(Gtk.Window):
 
         control_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         control_box.pack_start(self.auto_select_checkbox, False, False, 0)
+        control_box.pack_start(self.summary_checkbox, False, False, 0)
+        control_box.pack_start(self.fan_out_checkbox, False, False, 0)
+        control_box.pack_start(self.cache_checkbox, False, False, 0)
+        control_box.pack_start(self.invalidate_cache_button, False, False, 0)
         control_box.pack_start(self.clear_memory_button, False, False, 0)
         control_box.pack_start(self.clear_chat_button, False, False, 0)
         control_box.pack_start(self.save_button, False, False, 0)
@@ -122,26 +288,155 @@ class ChatWindow(Gtk.Window):
         ui_control_box.pack_start(self.font_increase_button, False, False, 0)
         ui_control_box.pack_start(self.font_decrease_button, False, False, 0)
         ui_control_box.pack_start(self.run_code_button, False, False, 0)
+        ui_control_box.pack_start(self.cancel_code_button, False, False, 0)
         ui_control_box.pack_start(self.download_model_button, False, False, 0)
         ui_control_box.pack_start(self.serve_model_button, False, False, 0)
+        ui_control_box.pack_start(self.stats_checkbox, False, False, 0)
         vbox.pack_start(ui_control_box, False, False, 0)
 
         vbox.pack_start(model_scroll, False, True, 0)
 
+        # Panel wyszukiwania pełnotekstowego we wszystkich zapisanych konwersacjach
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Szukaj w zapisanych konwersacjach")
+        self.search_entry.connect("search-changed", self.on_search_changed)
+
+        self.search_results = Gtk.ListStore(str, int, str, str)
+        self.search_view = Gtk.TreeView(model=self.search_results)
+        self.search_view.append_column(Gtk.TreeViewColumn("Konwersacja", Gtk.CellRendererText(), text=2))
+        self.search_view.append_column(Gtk.TreeViewColumn("Fragment", Gtk.CellRendererText(), text=3))
+        self.search_view.connect("row-activated", self.on_search_result_activated)
+
+        search_scroll = Gtk.ScrolledWindow()
+        search_scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        search_scroll.set_min_content_height(120)
+        search_scroll.add(self.search_view)
+
+        search_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        search_box.pack_start(self.search_entry, False, False, 0)
+        search_box.pack_start(search_scroll, True, True, 0)
+        search_expander = Gtk.Expander(label="Wyszukiwanie")
+        search_expander.add(search_box)
+        vbox.pack_start(search_expander, False, True, 0)
+
+        self.context_label = Gtk.Label(label="")
+        self.context_label.set_xalign(0)
+        vbox.pack_start(self.context_label, False, False, 0)
+
+        self.router_label = Gtk.Label(label="")
+        self.router_label.set_xalign(0)
+        vbox.pack_start(self.router_label, False, False, 0)
+
+        self.connection_label = Gtk.Label(label="")
+        self.connection_label.set_xalign(0)
+        vbox.pack_start(self.connection_label, False, False, 0)
+
+        self.cache_label = Gtk.Label(label="")
+        self.cache_label.set_xalign(0)
+        vbox.pack_start(self.cache_label, False, False, 0)
+
+        # Panel kolejki pobierania z paskiem postępu dla każdego modelu
+        self.pull_concurrency = Gtk.SpinButton.new_with_range(1, 8, 1)
+        self.pull_concurrency.set_value(self.pull_queue.max_concurrent)
+        self.pull_concurrency.connect("value-changed",
+                                      lambda spin: self.pull_queue.set_max_concurrent(spin.get_value_as_int()))
+        concurrency_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        concurrency_box.pack_start(Gtk.Label(label="Równoległe pobierania:"), False, False, 0)
+        concurrency_box.pack_start(self.pull_concurrency, False, False, 0)
+
+        self.pull_list = Gtk.ListBox()
+        self.pull_list.set_selection_mode(Gtk.SelectionMode.NONE)
+        pull_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        pull_box.pack_start(concurrency_box, False, False, 0)
+        pull_box.pack_start(self.pull_list, False, False, 0)
+        self.pull_expander = Gtk.Expander(label="Pobierania")
+        self.pull_expander.add(pull_box)
+        vbox.pack_start(self.pull_expander, False, False, 0)
+
         # Uruchamianie pętli zdarzeń asyncio w osobnym wątku
         self.loop = asyncio.new_event_loop()
         self.loop_thread = threading.Thread(target=self.start_loop, daemon=True)
         self.loop_thread.start()
 
-    def fetch_models_and_tags(self):
+        # Jeden klient z pulą połączeń na okno, używany wyłącznie z pętli asyncio
+        self.ollama = PooledOllamaClient()
+        self.connect("destroy", self.on_destroy)
+
+        asyncio.run_coroutine_threadsafe(self.fetch_models_and_tags(), self.loop)
+
+    def on_destroy(self, widget):
+        future = asyncio.run_coroutine_threadsafe(self.ollama.aclose(), self.loop)
+        future.result(timeout=5)
+        self.store.close()
+        self.response_cache.close()
+        self.telemetry.close()
+        if self.code_run is not None:
+            self.code_run.cancel()
+        self.code_runner.close()
+        self.pull_queue.close()
+
+    async def fetch_models_and_tags(self):
         try:
-            response = requests.get("https://ollama-models.zwz.workers.dev/")
-            data = response.json()
-            for model in data.get("models", []):
-                self.available_models.append(model["name"])
-                self.model_tags[model["name"]] = model["tags"]
+            await self.loop.run_in_executor(None, self.catalog.refresh)
         except Exception as e:
             print(f"Error fetching models and tags: {e}")
+        try:
+            self.installed_models = local_models(await self.ollama.client.list())
+        except Exception as e:
+            print(f"Error listing local models: {e}")
+        GLib.idle_add(self.apply_catalog, merge_catalog(self.catalog.models, self.installed_models))
+
+    def apply_catalog(self, models):
+        self.available_models = list(models)
+        self.model_tags = models
+        self.update_model_tree()
+        # Kandydaci odczytywani są z drzewa modeli w wątku GTK, do pętli asyncio trafia gotowa lista
+        self.warm_up_candidates()
+        return False
+
+    def warm_up_candidates(self):
+        candidates = self.auto_candidates()
+        if self.auto_select_enabled and candidates:
+            asyncio.run_coroutine_threadsafe(self.warm_up_best(candidates), self.loop)
+
+    def update_model_tree(self):
+        # Aktualizacja przyrostowa: zachowuje zaznaczenia i zmienia tylko wiersze, które się różnią
+        store = self.model_tree_store
+        existing = {}
+        iter = store.get_iter_first()
+        while iter:
+            model = store.get_value(iter, 1)
+            next_iter = store.iter_next(iter)
+            if model in self.model_tags:
+                existing[model] = iter
+            else:
+                store.remove(iter)
+            iter = next_iter
+
+        for model in self.available_models:
+            tags = self.model_tags.get(model, [])
+            installed_tags = self.installed_models.get(model, [])
+            parent = existing.get(model)
+            if parent is None:
+                parent = store.append(None, [False, model, "", bool(installed_tags)])
+            elif store.get_value(parent, 3) != bool(installed_tags):
+                store.set_value(parent, 3, bool(installed_tags))
+
+            present = set()
+            child_iter = store.iter_children(parent)
+            while child_iter:
+                tag = store.get_value(child_iter, 2)
+                next_iter = store.iter_next(child_iter)
+                if tag in tags:
+                    present.add(tag)
+                    if store.get_value(child_iter, 3) != (tag in installed_tags):
+                        store.set_value(child_iter, 3, tag in installed_tags)
+                else:
+                    store.remove(child_iter)
+                child_iter = next_iter
+            for tag in tags:
+                if tag not in present:
+                    store.append(parent, [False, f"{model}:{tag}", tag, tag in installed_tags])
 
     def on_model_toggled(self, widget, path):
         iter = self.model_tree_store.get_iter(path)
@@ -192,7 +487,7 @@ class ChatWindow(Gtk.Window):
         if response == Gtk.ResponseType.OK:
             selected_model = model_combo.get_active_text()
             selected_tag = tag_combo.get_active_text()
-            threading.Thread(target=self.download_model, args=(f"{selected_model}:{selected_tag}",)).start()
+            self.download_model(f"{selected_model}:{selected_tag}")
 
         dialog.destroy()
 
@@ -213,45 +508,312 @@ class ChatWindow(Gtk.Window):
         user_message = self.input_buffer.get_text(start_iter, end_iter, True)
         self.input_buffer.set_text("")
 
+        selected_models = self.get_selected_models_with_tags()
+        summarize = self.summary_checkbox.get_active()
+        if self.fan_out_checkbox.get_active() and len(selected_models) > 1:
+            self.conversation_history.append('user', user_message)
+            self.store.append_message(self.conversation_id, 'user', user_message, selected_models[0])
+            self.renderer.write(f"Użytkownik: {user_message}\n")
+            self.renderer.write(f"Porównywane modele: {', '.join(selected_models)}\n")
+            comparison = ComparisonWindow(self, selected_models)
+            comparison.show_all()
+            timers = {model: self.telemetry.request(model) for model in selected_models}
+            asyncio.run_coroutine_threadsafe(self.fan_out(selected_models, comparison, summarize, self.conversation_id,
+                                                          timers), self.loop)
+            return
+
+        if self.auto_select_enabled:
+            candidates = self.auto_candidates()
+            if not candidates:
+                self.renderer.write("Brak dostępnych modeli.\n")
+                return
+            self.conversation_history.append('user', user_message)
+            self.store.append_message(self.conversation_id, 'user', user_message)
+            self.renderer.write(f"Użytkownik: {user_message}\n")
+            asyncio.run_coroutine_threadsafe(self.auto_respond(candidates, summarize, self.conversation_id,
+                                                               self.telemetry.request()), self.loop)
+            return
+
         selected_model = self.get_selected_model_with_tag()
 
-        self.conversation_history.append({'role': 'user', 'content': user_message})
-        self.chat_buffer.insert_at_cursor(f"Użytkownik: {user_message}\n")
-        self.chat_buffer.insert_at_cursor(f"Wybrany model: {selected_model}\n")
-        asyncio.run_coroutine_threadsafe(self.get_response(selected_model), self.loop)
+        self.conversation_history.append('user', user_message)
+        self.store.append_message(self.conversation_id, 'user', user_message, selected_model)
+        self.renderer.write(f"Użytkownik: {user_message}\n")
+        self.renderer.write(f"Wybrany model: {selected_model}\n")
+        asyncio.run_coroutine_threadsafe(self.get_response(selected_model, summarize, self.conversation_id,
+                                                           timer=self.telemetry.request()), self.loop)
+
+    def on_auto_select_toggled(self, widget):
+        self.auto_select_enabled = widget.get_active()
+        self.warm_up_candidates()
+
+    def auto_candidates(self):
+        # Zaznaczone modele, a gdy nic nie zaznaczono - wszystkie pobrane lokalnie
+        selected = self.get_selected_models_with_tags()
+        if selected:
+            return selected
+        installed = [f"{model}:{tag}" for model, tags in self.installed_models.items() for tag in tags]
+        return installed or self.available_models[:1]
+
+    async def refresh_loaded_models(self):
+        try:
+            self.router.set_loaded(loaded_model_names(await self.ollama.client.ps()))
+        except Exception as e:
+            print(f"Error listing loaded models: {e}")
+
+    async def choose_model(self, candidates, prompt_tokens):
+        for model in candidates:
+            await self.context_budget(model)
+        await self.refresh_loaded_models()
+        return self.router.choose(candidates, prompt_tokens, self.context_limits)
+
+    async def auto_respond(self, candidates, summarize, conversation_id, timer):
+        messages, prompt_tokens = self.conversation_history.request_messages()
+        selected_model = await self.choose_model(candidates, prompt_tokens)
+        self.renderer.write(f"Wybrany model (auto): {selected_model}\n")
+        await self.get_response(selected_model, summarize, conversation_id, keep_alive=KEEP_ALIVE, timer=timer)
+        GLib.idle_add(self.router_label.set_text, self.router.summary(selected_model))
+
+    async def warm_up_best(self, candidates):
+        selected_model = await self.choose_model(candidates, 0)
+        if self.router.is_loaded(selected_model):
+            return
+        try:
+            # Pusty prompt tylko ładuje model do pamięci, więc pierwsze pytanie nie płaci za zimny start
+            await self.ollama.client.generate(model=selected_model, prompt="", keep_alive=KEEP_ALIVE)
+            await self.refresh_loaded_models()
+        except Exception as e:
+            print(f"Error preloading {selected_model}: {e}")
 
-    def get_selected_model_with_tag(self):
+    def get_selected_models_with_tags(self):
+        selected = []
         iter = self.model_tree_store.get_iter_first()
         while iter:
             if self.model_tree_store.get_value(iter, 0):  # jeśli model jest zaznaczony
                 model = self.model_tree_store.get_value(iter, 1)
+                tags = []
                 child_iter = self.model_tree_store.iter_children(iter)
                 while child_iter:
                     if self.model_tree_store.get_value(child_iter, 0):  # jeśli tag jest zaznaczony
-                        tag = self.model_tree_store.get_value(child_iter, 2)
-                        return f"{model}:{tag}"
+                        tags.append(self.model_tree_store.get_value(child_iter, 2))
                     child_iter = self.model_tree_store.iter_next(child_iter)
-                return model  # jeśli żaden tag nie jest zaznaczony, zwróć sam model
+                if tags:
+                    selected.extend(f"{model}:{tag}" for tag in tags)
+                else:
+                    selected.append(model)  # jeśli żaden tag nie jest zaznaczony, sam model
             iter = self.model_tree_store.iter_next(iter)
-        return self.available_models[0]  # jeśli nic nie jest zaznaczone, zwróć pierwszy dostępny model
+        return selected
 
-    async def get_response(self, selected_model):
-        async for part in await AsyncClient().chat(model=selected_model, messages=self.conversation_history, stream=True):
-            content = part['message']['content']
-            GLib.idle_add(self.chat_buffer.insert_at_cursor, content)
-        GLib.idle_add(self.chat_buffer.insert_at_cursor, "\n")
+    def get_selected_model_with_tag(self):
+        selected = self.get_selected_models_with_tags()
+        if selected:
+            return selected[0]
+        return self.available_models[0]  # jeśli nic nie jest zaznaczone, zwróć pierwszy dostępny model
 
-        self.conversation_history.append({'role': 'assistant', 'content': content})
-        self.trim_conversation_history()
+    async def context_budget(self, model):
+        if model not in self.context_limits:
+            try:
+                length = context_length_from_show(await self.ollama.client.show(model))
+            except Exception as e:
+                print(f"Error reading context length of {model}: {e}")
+                length = None
+            self.context_limits[model] = min(length or DEFAULT_CONTEXT_TOKENS, MAX_CONTEXT_TOKENS)
+        return self.context_limits[model]
+
+    async def stream_chat(self, timer, renderer, **kwargs):
+        # Strumieniuje odpowiedź do wskazanego bufora i zapisuje pomiary żądania.
+        # Zwraca (odpowiedź, ostatni fragment, czy odtworzono z pamięci odpowiedzi).
+        model, options, messages = kwargs['model'], kwargs.get('options'), kwargs['messages']
+        if self.cache_enabled:
+            entry = self.response_cache.get(model, options, messages)
+            if entry is None:
+                # Odczyt z dysku w wątku pamięci odpowiedzi, żeby nie wstrzymywać innych strumieni
+                entry = await asyncio.wrap_future(self.response_cache.load(model, options, messages))
+            GLib.idle_add(self.cache_label.set_text, self.response_cache.summary())
+            if entry is not None:
+                # Odtworzenie tą samą ścieżką co strumień z serwera, osobno w statystykach
+                timer.start(f"{model} [pamięć]")
+                for chunk in entry['chunks']:
+                    timer.token()
+                    renderer.write(chunk)
+                final = entry['final']
+                timer.finish(prompt_tokens=final.get('prompt_eval_count'), completion_tokens=final.get('eval_count'))
+                GLib.idle_add(self.update_stats_overlay, timer)
+                return "".join(entry['chunks']), final, True
+        timer.start(model)
+        response_parts = []
+        final = {}
+        try:
+            async for part in self.ollama.chat_stream(**kwargs):
+                content = part['message']['content']
+                if content:
+                    timer.token()
+                    response_parts.append(content)
+                    renderer.write(content)
+                if part.get('done'):
+                    final = part
+        except Exception as e:
+            timer.finish(error=str(e))
+            GLib.idle_add(self.update_stats_overlay, timer)
+            raise
+        timer.finish(prompt_tokens=final.get('prompt_eval_count'), completion_tokens=final.get('eval_count'))
+        GLib.idle_add(self.update_stats_overlay, timer)
+        if self.cache_enabled and response_parts:
+            self.response_cache.put(model, options, messages, response_parts, final).add_done_callback(
+                lambda future: GLib.idle_add(self.cache_label.set_text, self.response_cache.summary()))
+        return "".join(response_parts), final, False
+
+    def update_stats_overlay(self, timer):
+        self.stats_overlay.set_text(format_stats_overlay(timer, self.telemetry.snapshot()))
+        if self.stats_checkbox.get_active():
+            self.stats_overlay.show()
+        return False
+
+    def on_stats_toggled(self, widget):
+        self.stats_overlay.set_visible(widget.get_active() and bool(self.stats_overlay.get_text()))
+
+    async def get_response(self, selected_model, summarize=False, conversation_id=None, keep_alive=None, timer=None):
+        timer = timer or self.telemetry.request()
+        budget = await self.context_budget(selected_model)
+        self.conversation_history.set_budget(budget)
+        self.conversation_history.trim(keep_evicted=summarize)
+        messages, estimated_tokens = self.conversation_history.request_messages()
+
+        was_loaded = self.router.is_loaded(selected_model)
+        try:
+            response, final, cached = await self.stream_chat(timer, self.renderer, model=selected_model,
+                                                             messages=messages, options={'num_ctx': budget},
+                                                             keep_alive=keep_alive)
+        except Exception as e:
+            self.router.record(selected_model, error=True)
+            self.renderer.write(f"\nBłąd podczas generowania odpowiedzi: {str(e)}\n")
+            return
+        self.renderer.write("\n")
+        prompt_tokens = timer.prompt_tokens
+        if not cached:
+            self.router.record(selected_model, ttft=timer.ttft, tokens_per_second=timer.tokens_per_second,
+                               was_loaded=was_loaded)
+        GLib.idle_add(self.connection_label.set_text, self.ollama.stats.summary())
+        GLib.idle_add(self.context_label.set_text,
+                      f"Tokeny promptu: szacowane {estimated_tokens}, zliczone przez serwer {prompt_tokens or '?'}, "
+                      f"budżet {budget}")
+
+        self.conversation_history.append('assistant', response)
+        if conversation_id is not None:
+            self.store.append_message(conversation_id, 'assistant', response, selected_model)
+        self.conversation_history.calibrate(estimated_tokens, prompt_tokens)
+        if summarize:
+            await self.summarize_evicted(selected_model)
+
+    async def fan_out(self, models, comparison, summarize, conversation_id, timers):
+        # Kontekst przycinany jest do najmniejszego budżetu, aby wszystkie modele dostały ten sam prompt
+        budgets = [await self.context_budget(model) for model in models]
+        budget = min(budgets)
+        self.conversation_history.set_budget(budget)
+        self.conversation_history.trim(keep_evicted=summarize)
+        messages, estimated_tokens = self.conversation_history.request_messages()
+
+        semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+        results = await asyncio.gather(*(self.stream_to_pane(model, messages, budget, comparison.renderers[model],
+                                                             semaphore, timers[model]) for model in models))
+        for result in results:
+            # Odpowiedzi z pamięci nie mówią nic o szybkości modelu
+            if result['cached']:
+                continue
+            self.router.record(result['model'], ttft=result['ttft'], tokens_per_second=result['tokens_per_second'],
+                               error=result['error'] is not None)
+        summary = format_fan_out_summary(results)
+        GLib.idle_add(comparison.show_summary, summary)
+        self.renderer.write(f"Podsumowanie porównania:\n{summary}\n")
+
+        # Do historii rozmowy trafia odpowiedź pierwszego zaznaczonego modelu
+        first = results[0]
+        if first['error'] is None:
+            self.conversation_history.append('assistant', first['response'])
+            self.store.append_message(conversation_id, 'assistant', first['response'], first['model'])
+            self.renderer.write(f"{first['response']}\n")
+        if summarize:
+            await self.summarize_evicted(first['model'])
+
+    async def stream_to_pane(self, model, messages, budget, renderer, semaphore, timer):
+        # Czas oczekiwania na semafor liczony jest jako czas w kolejce
+        async with semaphore:
+            error = None
+            response = ""
+            cached = False
+            try:
+                response, final, cached = await self.stream_chat(timer, renderer, model=model, messages=messages,
+                                                                 options={'num_ctx': budget})
+            except Exception as e:
+                error = str(e)
+                renderer.write(f"\nBłąd: {error}\n")
+        return {
+            'model': model,
+            'ttft': timer.ttft,
+            'tokens_per_second': timer.tokens_per_second,
+            'total': timer.total,
+            'error': error,
+            'response': response,
+            'cached': cached,
+        }
+
+    async def summarize_evicted(self, selected_model):
+        evicted = self.conversation_history.take_evicted()
+        if not evicted:
+            return
+        try:
+            response = await self.ollama.client.chat(model=SUMMARY_MODEL or selected_model,
+                                                     messages=self.conversation_history.summary_request(evicted))
+            self.conversation_history.set_summary(response['message']['content'])
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+
+    def on_cache_toggled(self, widget):
+        self.cache_enabled = widget.get_active()
+        self.cache_label.set_text(self.response_cache.summary() if self.cache_enabled else "")
+
+    def invalidate_response_cache(self, widget):
+        # Unieważnia odpowiedzi zaznaczonych modeli albo wszystkie, gdy nic nie jest zaznaczone
+        models = self.get_selected_models_with_tags()
+        if models:
+            for model in models:
+                future = self.response_cache.invalidate(model)
+            self.renderer.write(f"Usunięto zapamiętane odpowiedzi modeli: {', '.join(models)}\n")
+        else:
+            future = self.response_cache.invalidate()
+            self.renderer.write("Usunięto wszystkie zapamiętane odpowiedzi.\n")
+        self.cache_label.set_text(self.response_cache.summary())
+        # Pliki usuwane są w tle; etykieta pokazuje rozmiar na dysku po ich usunięciu
+        future.add_done_callback(lambda future: GLib.idle_add(self.cache_label.set_text,
+                                                              self.response_cache.summary()))
 
     def clear_memory(self, widget):
         gc.collect()
-        self.chat_buffer.insert_at_cursor("Pamięć wyczyszczona.\n")
+        self.renderer.write("Pamięć wyczyszczona.\n")
 
     def clear_chat(self, widget):
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self.conversation_id = new_conversation_id()
+        self.oldest_loaded_seq = None
+        self.newest_loaded_seq = None
+        self.stored_end_seq = None
+        self.renderer.discard()
         self.chat_buffer.set_text("")
-        self.chat_buffer.insert_at_cursor("Czat wyczyszczony.\n")
+        self.renderer.write("Czat wyczyszczony.\n")
+
+    def when_stored(self, future, callback):
+        # Wyniki z wątku bazy danych są przekazywane do głównej pętli GTK
+        future.add_done_callback(lambda future: GLib.idle_add(self.deliver_store_result, future, callback))
+
+    def deliver_store_result(self, future, callback):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.loading_page = False
+            self.renderer.write(f"Błąd bazy konwersacji: {str(e)}\n")
+            return False
+        callback(result)
+        return False
 
     def save_conversation(self, widget):
         dialog = Gtk.FileChooserDialog("Zapisz konwersację", self,
@@ -260,23 +822,172 @@ class ChatWindow(Gtk.Window):
                                         Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            with open(dialog.get_filename(), 'w') as file:
-                json.dump(self.conversation_history, file)
-            self.chat_buffer.insert_at_cursor("Konwersacja zapisana.\n")
+            future = self.store.export_json(self.conversation_id, dialog.get_filename())
+            self.when_stored(future, lambda result: self.renderer.write("Konwersacja zapisana.\n"))
         dialog.destroy()
 
     def load_conversation(self, widget):
-        dialog = Gtk.FileChooserDialog("Wczytaj konwersację", self,
+        self.when_stored(self.store.list_conversations(), self.show_conversation_dialog)
+
+    def show_conversation_dialog(self, conversations):
+        dialog = Gtk.Dialog(title="Wczytaj konwersację", parent=self)
+        dialog.add_buttons("Importuj plik JSON", RESPONSE_IMPORT,
+                           Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                           Gtk.STOCK_OPEN, Gtk.ResponseType.OK)
+        dialog.set_default_size(500, 400)
+
+        list_store = Gtk.ListStore(str, str, str, int)
+        for conversation_id, title, model, created, updated, message_count in conversations:
+            list_store.append([conversation_id, title or "(bez tytułu)",
+                               time.strftime("%Y-%m-%d %H:%M", time.localtime(updated)), message_count])
+        list_view = Gtk.TreeView(model=list_store)
+        for index, title in ((1, "Tytuł"), (2, "Zmieniono"), (3, "Wiadomości")):
+            list_view.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=index))
+
+        list_scroll = Gtk.ScrolledWindow()
+        list_scroll.add(list_view)
+        dialog.get_content_area().pack_start(list_scroll, True, True, 0)
+        dialog.show_all()
+
+        response = dialog.run()
+        if response == Gtk.ResponseType.OK:
+            model, iter = list_view.get_selection().get_selected()
+            if iter:
+                self.open_conversation(model.get_value(iter, 0))
+        elif response == RESPONSE_IMPORT:
+            self.import_conversation()
+        dialog.destroy()
+
+    def import_conversation(self):
+        dialog = Gtk.FileChooserDialog("Importuj konwersację", self,
                                        Gtk.FileChooserAction.OPEN,
                                        (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
                                         Gtk.STOCK_OPEN, Gtk.ResponseType.OK))
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            with open(dialog.get_filename(), 'r') as file:
-                self.conversation_history = json.load(file)
-            self.chat_buffer.insert_at_cursor("Konwersacja wczytana.\n")
+            self.when_stored(self.store.import_json(dialog.get_filename()), self.open_conversation)
         dialog.destroy()
 
+    def open_conversation(self, conversation_id, target_seq=None):
+        self.conversation_id = conversation_id
+        self.oldest_loaded_seq = None
+        self.newest_loaded_seq = None
+        self.stored_end_seq = None
+        self.conversation_history.clear()
+        self.renderer.discard()
+        self.chat_buffer.set_text("")
+        if target_seq is None:
+            future = self.store.load_page(conversation_id)
+        else:
+            future = self.store.load_from(conversation_id, target_seq)
+        self.when_stored(future, lambda rows: self.show_page(conversation_id, rows, target_seq))
+
+    def show_page(self, conversation_id, rows, target_seq=None):
+        if conversation_id != self.conversation_id:
+            return
+        self.oldest_loaded_seq = rows[0][0] if rows else 0
+        if target_seq is None:
+            self.load_history(conversation_id, rows)
+        else:
+            # Skok do wyniku wczytuje tylko stronę wokół niego; kontekst modelu to zawsze koniec konwersacji
+            if len(rows) == PAGE_SIZE:
+                self.newest_loaded_seq = rows[-1][0]
+            self.when_stored(self.store.load_page(conversation_id),
+                             lambda tail: self.load_history(conversation_id, tail))
+        for seq, role, content in rows:
+            start_offset = self.chat_buffer.get_char_count()
+            self.chat_buffer.insert(self.chat_buffer.get_end_iter(), format_message(role, content))
+            if seq == target_seq:
+                start = self.chat_buffer.get_iter_at_offset(start_offset)
+                self.chat_buffer.apply_tag(self.search_hit_tag, start, self.chat_buffer.get_end_iter())
+                self.chat_buffer.move_mark(self.search_hit_mark, start)
+        self.chat_buffer.move_mark(self.newer_mark, self.chat_buffer.get_end_iter())
+        self.renderer.write("Konwersacja wczytana.\n")
+        if target_seq is not None:
+            self.chat_view.scroll_to_mark(self.search_hit_mark, 0.0, True, 0.0, 0.1)
+        else:
+            self.chat_view.scroll_to_mark(self.renderer.end_mark, 0.0, True, 0.0, 1.0)
+
+    def load_history(self, conversation_id, rows):
+        if conversation_id == self.conversation_id:
+            self.conversation_history.load([{'role': role, 'content': content} for seq, role, content in rows])
+            # Wiadomości zapisane później są już wyświetlone jako bieżąca rozmowa
+            self.stored_end_seq = rows[-1][0] if rows else -1
+
+    def on_search_changed(self, entry):
+        self.search_generation += 1
+        generation = self.search_generation
+        text = entry.get_text()
+        if not text.strip():
+            self.search_results.clear()
+            return
+        self.when_stored(self.store.search(text), lambda hits: self.show_search_results(generation, hits))
+
+    def show_search_results(self, generation, hits):
+        # Wyniki starszych zapytań, które skończyły się później, są pomijane
+        if generation != self.search_generation:
+            return
+        self.search_results.clear()
+        for conversation_id, seq, title, snippet in hits:
+            self.search_results.append([conversation_id, seq, title or "(bez tytułu)", snippet.replace("\n", " ")])
+
+    def on_search_result_activated(self, view, path, column):
+        row = self.search_results[path]
+        self.open_conversation(row[0], row[1])
+
+    def on_chat_scrolled(self, adjustment):
+        if adjustment.get_value() <= adjustment.get_lower():
+            self.load_older_page()
+        elif adjustment.get_value() >= adjustment.get_upper() - adjustment.get_page_size():
+            self.load_newer_page()
+
+    def on_chat_resized(self, adjustment):
+        # Strona, która nie wypełnia widoku, nie da się przewinąć, więc kolejna jest doczytywana od razu
+        if adjustment.get_upper() - adjustment.get_lower() <= adjustment.get_page_size():
+            self.load_older_page()
+            self.load_newer_page()
+
+    def load_older_page(self):
+        if self.loading_page or not self.oldest_loaded_seq:
+            return
+        self.loading_page = True
+        conversation_id = self.conversation_id
+        self.when_stored(self.store.load_page(conversation_id, self.oldest_loaded_seq),
+                         lambda rows: self.prepend_page(conversation_id, rows))
+
+    def prepend_page(self, conversation_id, rows):
+        self.loading_page = False
+        if conversation_id != self.conversation_id or not rows:
+            return
+        self.oldest_loaded_seq = rows[0][0]
+        # Kotwica zostaje przy dotychczasowym początku tekstu, więc widok nie przeskakuje po doczytaniu strony
+        self.chat_buffer.move_mark(self.page_anchor, self.chat_buffer.get_start_iter())
+        self.chat_buffer.insert(self.chat_buffer.get_start_iter(),
+                                "".join(format_message(role, content) for seq, role, content in rows))
+        self.chat_view.scroll_to_mark(self.page_anchor, 0.0, True, 0.0, 0.0)
+
+    def load_newer_page(self):
+        if self.loading_page or self.newest_loaded_seq is None:
+            return
+        self.loading_page = True
+        conversation_id = self.conversation_id
+        self.when_stored(self.store.load_after(conversation_id, self.newest_loaded_seq),
+                         lambda rows: self.append_page(conversation_id, rows))
+
+    def append_page(self, conversation_id, rows):
+        self.loading_page = False
+        if conversation_id != self.conversation_id:
+            return
+        self.newest_loaded_seq = rows[-1][0] if len(rows) == PAGE_SIZE else None
+        if self.stored_end_seq is not None and (not rows or rows[-1][0] >= self.stored_end_seq):
+            rows = [row for row in rows if row[0] <= self.stored_end_seq]
+            self.newest_loaded_seq = None
+        text = "".join(format_message(role, content) for seq, role, content in rows)
+        position = self.chat_buffer.get_iter_at_mark(self.newer_mark)
+        offset = position.get_offset() + len(text)
+        self.chat_buffer.insert(position, text)
+        self.chat_buffer.move_mark(self.newer_mark, self.chat_buffer.get_iter_at_offset(offset))
+
     def toggle_theme(self, widget):
         settings = Gtk.Settings.get_default()
         dark_mode = settings.get_property("gtk-application-prefer-dark-theme")
@@ -298,44 +1009,117 @@ class ChatWindow(Gtk.Window):
         code = self.input_buffer.get_text(start_iter, end_iter, True)
         self.input_buffer.set_text("")
 
-        try:
-            exec_locals = {}
-            exec(code, {}, exec_locals)
-            output = exec_locals.get('output', 'Kod wykonany pomyślnie.')
-        except Exception as e:
-            output = f'Błąd wykonania kodu: {str(e)}'
-
-        self.chat_buffer.insert_at_cursor(f"Wynik wykonania kodu:\n{output}\n")
+        self.run_code_button.set_sensitive(False)
+        self.cancel_code_button.set_sensitive(True)
+        self.renderer.write("Wynik wykonania kodu:\n")
+        # Wyjście trafia do czatu na bieżąco przez renderer, który można wywoływać z dowolnego wątku
+        self.code_run = self.code_runner.run(code, lambda stream, text: self.renderer.write(text),
+                                             lambda result: GLib.idle_add(self.on_python_code_finished, result))
+
+    def cancel_python_code(self, widget):
+        if self.code_run is not None:
+            self.code_run.cancel()
+            self.cancel_code_button.set_sensitive(False)
+
+    def on_python_code_finished(self, result):
+        status = result['status']
+        if status == 'ok':
+            output = result['output'] if result['output'] is not None else 'Kod wykonany pomyślnie.'
+        elif status == 'error':
+            output = f"Błąd wykonania kodu: {result['error']}"
+        elif status == 'cancelled':
+            output = "Wykonanie kodu przerwane."
+        elif status == 'timeout':
+            output = f"Przekroczono limit czasu ({self.code_runner.wall_seconds} s)."
+        elif status == 'cpu_limit':
+            output = f"Przekroczono limit czasu procesora ({self.code_runner.cpu_seconds} s)."
+        elif status == 'memory_limit':
+            output = f"Przekroczono limit pamięci ({self.code_runner.memory_mb} MB)."
+        else:
+            output = f"Proces wykonujący kod zakończył się nieoczekiwanie (kod {result.get('returncode')})."
+        self.renderer.write(f"\n{output}\n")
+        self.code_run = None
+        self.run_code_button.set_sensitive(True)
+        self.cancel_code_button.set_sensitive(False)
+        return False
 
     def serve_model(self, widget):
         try:
             command = ["ollama", "serve"]
             subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            self.chat_buffer.insert_at_cursor("Serwer modeli został uruchomiony.\n")
+            self.renderer.write("Serwer modeli został uruchomiony.\n")
         except Exception as e:
-            self.chat_buffer.insert_at_cursor(f"Wystąpił błąd podczas uruchamiania serwera: {str(e)}\n")
+            self.renderer.write(f"Wystąpił błąd podczas uruchamiania serwera: {str(e)}\n")
 
     def download_model(self, model_name):
-        try:
-            command = ["ollama", "pull", model_name]
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-            for line in process.stdout:
-                GLib.idle_add(self.chat_buffer.insert_at_cursor, line)
-
-            process.wait()
-            if process.returncode == 0:
-                GLib.idle_add(self.chat_buffer.insert_at_cursor, f"Model {model_name} został pobrany.\n")
-            else:
-                GLib.idle_add(self.chat_buffer.insert_at_cursor, f"Błąd podczas pobierania modelu {model_name}.\n")
-        except Exception as e:
-            GLib.idle_add(self.chat_buffer.insert_at_cursor, f"Wystąpił błąd: {str(e)}\n")
-
-    def trim_conversation_history(self):
-        if len(self.conversation_history) > 50:
-            self.conversation_history = self.conversation_history[-50:]
-
-win = ChatWindow()
-win.connect("destroy", Gtk.main_quit)
-win.show_all()
-Gtk.main()
+        self.pull_queue.add(model_name)
+        self.pull_expander.set_expanded(True)
+
+    def update_pull_row(self, job):
+        row = self.pull_rows.get(job.model)
+        if job.state == CANCELLED:
+            if row is not None:
+                self.pull_list.remove(row['row'])
+                del self.pull_rows[job.model]
+            return False
+        if row is None:
+            row = self.add_pull_row(job.model)
+        if job.state == RUNNING and job.total:
+            text = f"{format_bytes(job.completed)} / {format_bytes(job.total)}, {format_bytes(job.rate)}/s"
+        elif job.state == RUNNING:
+            text = job.status or "uruchamianie"
+        elif job.state == FAILED:
+            text = f"błąd: {job.error}"
+        else:
+            text = {QUEUED: "w kolejce", PAUSED: "wstrzymane", DONE: "pobrano"}[job.state]
+        row['bar'].set_fraction(1.0 if job.state == DONE else job.fraction)
+        row['bar'].set_text(text)
+        row['pause'].set_label("Wznów" if job.state in (PAUSED, FAILED) else "Wstrzymaj")
+        row['pause'].set_sensitive(job.state != DONE)
+        row['cancel'].set_label("Usuń" if job.state in (DONE, FAILED) else "Anuluj")
+        return False
+
+    def add_pull_row(self, model):
+        label = Gtk.Label(label=model)
+        label.set_xalign(0)
+        label.set_width_chars(24)
+        bar = Gtk.ProgressBar()
+        bar.set_show_text(True)
+        pause_button = Gtk.Button.new_with_label("Wstrzymaj")
+        pause_button.connect("clicked", self.on_pull_pause_clicked, model)
+        cancel_button = Gtk.Button.new_with_label("Anuluj")
+        cancel_button.connect("clicked", lambda button: self.pull_queue.cancel(model))
+        box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        box.pack_start(label, False, False, 0)
+        box.pack_start(bar, True, True, 0)
+        box.pack_start(pause_button, False, False, 0)
+        box.pack_start(cancel_button, False, False, 0)
+        row = Gtk.ListBoxRow()
+        row.add(box)
+        row.show_all()
+        self.pull_list.add(row)
+        self.pull_rows[model] = {'row': row, 'bar': bar, 'pause': pause_button, 'cancel': cancel_button}
+        return self.pull_rows[model]
+
+    def on_pull_pause_clicked(self, button, model):
+        if button.get_label() == "Wznów":
+            # Nieudane pobieranie wznawiane jest przez ponowne dodanie do kolejki
+            self.pull_queue.add(model)
+        else:
+            self.pull_queue.pause(model)
+
+    def on_pull_finished(self, job):
+        if job.state == DONE:
+            self.renderer.write(f"Model {job.model} został pobrany.\n")
+            # Nowa wersja modelu może odpowiadać inaczej
+            self.response_cache.invalidate(job.model)
+            asyncio.run_coroutine_threadsafe(self.fetch_models_and_tags(), self.loop)
+        elif job.state == FAILED:
+            self.renderer.write(f"Błąd podczas pobierania modelu {job.model}: {job.error}\n")
+        return False
+
+if __name__ == '__main__':
+    win = ChatWindow()
+    win.connect("destroy", Gtk.main_quit)
+    win.show_all()
+    Gtk.main()
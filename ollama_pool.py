@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 300.0
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+KEEPALIVE_EXPIRY = 60.0
+RETRIES = 3
+BACKOFF = 0.5
+
+TRANSIENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout,
+                    httpx.RemoteProtocolError, httpx.PoolTimeout)
+NEW_CONNECTION_EVENTS = ("connection.connect_tcp.started", "connection.connect_unix_socket.started")
+
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.retries = 0
+
+    def record_request(self, new_connection):
+        with self.lock:
+            self.requests += 1
+            if new_connection:
+                self.new_connections += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    @property
+    def reused_connections(self):
+        return self.requests - self.new_connections
+
+    def reuse_ratio(self):
+        return self.reused_connections / self.requests if self.requests else 0.0
+
+    def summary(self):
+        return (f"Połączenia: nowe {self.new_connections}, ponownie użyte {self.reused_connections} "
+                f"({self.reuse_ratio():.0%}), ponowienia {self.retries}")
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    # Uses the httpcore trace hook to tell whether a request opened a new connection or reused a pooled one
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        opened = False
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name, info):
+            nonlocal opened
+            if event_name in NEW_CONNECTION_EVENTS:
+                opened = True
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        response = await super().handle_async_request(request)
+        self.stats.record_request(opened)
+        return response
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, ResponseError) and error.status_code in (429, 502, 503, 504)
+
+class PooledOllamaClient:
+    # One long-lived AsyncClient per window; it must only be used from the window's asyncio loop
+    def __init__(self, host=None, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY, retries=RETRIES, backoff=BACKOFF):
+        self.host = host
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = ConnectionStats()
+        self._client = None
+        self._transport = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # ollama builds its own httpx client, so the pool is closed through the transport we hand it
+            self._transport = PooledTransport(self.stats, limits=self.limits, retries=1)
+            self._client = AsyncClient(host=self.host, timeout=self.timeout, transport=self._transport)
+        return self._client
+
+    async def with_retries(self, make_call):
+        for attempt in range(self.retries + 1):
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt == self.retries or not is_transient(e):
+                    raise
+                self.stats.record_retry()
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def chat_stream(self, **kwargs):
+        # Only the request and the first chunk are retried; once text has been shown a failure is final
+        async def open_stream():
+            stream = await self.client.chat(stream=True, **kwargs)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return stream, first
+
+        stream, first = await self.with_retries(open_stream)
+        if first is None:
+            return
+        yield first
+        async for part in stream:
+            yield part
+
+    async def aclose(self):
+        if self._transport is not None:
+            await self._transport.aclose()
+            self._client = None
+            self._transport = None
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import time
+import signal
+import threading
+import subprocess
+
+# Path of the ollama executable; pointing it at a fake script makes the queue testable offline
+OLLAMA_BIN = os.environ.get("OLLAMA_BIN", "ollama")
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "chatbotapp")
+QUEUE_PATH = os.path.join(DATA_DIR, "pull_queue.json")
+MAX_CONCURRENT = 2
+UPDATE_INTERVAL = 0.2
+RATE_SMOOTHING = 0.3
+STOP_GRACE = 5.0
+READ_SIZE = 4096
+
+QUEUED, RUNNING, PAUSED, DONE, FAILED, CANCELLED = "queued", "running", "paused", "done", "failed", "cancelled"
+# Only these states are written to disk; finished pulls are not restored
+PERSISTED_STATES = (QUEUED, RUNNING, PAUSED)
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+LINE_BREAK = re.compile(r"[\r\n]")
+# "pulling 6a0746a1ec1a...  45% ▕████     ▏ 2.1 GB/4.7 GB   50 MB/s   52s"
+LAYER_PROGRESS = re.compile(r"^pulling (?P<digest>[0-9a-f]+)\S*\s+(?P<percent>\d+)%.*?"
+                            r"(?P<completed>[\d.]+\s*[KMGT]?B)\s*/\s*(?P<total>[\d.]+\s*[KMGT]?B)"
+                            r"(?:\s+(?P<rate>[\d.]+\s*[KMGT]?B)/s)?")
+UNITS = {"B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+def parse_size(text):
+    # ollama prints decimal units
+    match = re.match(r"([\d.]+)\s*([KMGT]?B)", text.strip())
+    if not match:
+        return 0
+    return int(float(match.group(1)) * UNITS[match.group(2)])
+
+def parse_progress(line):
+    # Returns (digest, completed, total, rate) for a layer progress line, otherwise None
+    match = LAYER_PROGRESS.match(line)
+    if not match:
+        return None
+    rate = parse_size(match.group("rate")) if match.group("rate") else None
+    return match.group("digest"), parse_size(match.group("completed")), parse_size(match.group("total")), rate
+
+def split_lines(buffer, data):
+    # ollama redraws its progress bars with \r and ANSI cursor moves rather than newlines
+    buffer += ANSI_ESCAPE.sub("", data)
+    parts = LINE_BREAK.split(buffer)
+    return [part.strip() for part in parts[:-1] if part.strip()], parts[-1]
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1000 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1000
+
+class PullJob:
+    def __init__(self, model, state=QUEUED):
+        self.model = model
+        self.state = state
+        self.status = ""
+        self.layers = {}
+        self.rate = 0.0
+        self.rate_time = None
+        self.error = None
+        self.process = None
+        self.stop_state = None
+        self.last_notified = 0.0
+
+    @property
+    def completed(self):
+        return sum(completed for completed, total in self.layers.values())
+
+    @property
+    def total(self):
+        return sum(total for completed, total in self.layers.values())
+
+    @property
+    def fraction(self):
+        return self.completed / self.total if self.total else 0.0
+
+    def update(self, line):
+        progress = parse_progress(line)
+        if progress is None:
+            self.status = line
+            return
+        digest, completed, total, rate = progress
+        previous = self.completed
+        self.layers[digest] = (completed, total)
+        self.status = "pulling"
+        if rate is not None:
+            self.rate = rate
+        else:
+            # Older ollama versions print no rate; estimate it from the progress between updates
+            now = time.perf_counter()
+            elapsed = now - self.rate_time if self.rate_time is not None else 0
+            if elapsed > 0:
+                sample = max(self.completed - previous, 0) / elapsed
+                self.rate = (1 - RATE_SMOOTHING) * self.rate + RATE_SMOOTHING * sample
+            self.rate_time = now
+
+class PullQueue:
+    # Runs `ollama pull` for queued models, at most max_concurrent at a time.
+    # Pausing stops the process; ollama keeps partial layers, so resuming continues the download.
+    def __init__(self, on_update=None, on_finished=None, max_concurrent=MAX_CONCURRENT, path=QUEUE_PATH,
+                 ollama_bin=OLLAMA_BIN):
+        self.on_update = on_update
+        self.on_finished = on_finished
+        self.max_concurrent = max_concurrent
+        self.path = path
+        self.ollama_bin = ollama_bin
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.closing = False
+
+    def restore(self):
+        # Pulls interrupted by closing the app are queued again
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            saved = {}
+        with self.lock:
+            self.max_concurrent = saved.get("max_concurrent", self.max_concurrent)
+            for entry in saved.get("jobs", []):
+                if not any(job.model == entry["model"] for job in self.jobs):
+                    self.jobs.append(PullJob(entry["model"], PAUSED if entry["state"] == PAUSED else QUEUED))
+            jobs = list(self.jobs)
+        for job in jobs:
+            self.notify(job, force=True)
+        self.schedule()
+
+    def save(self):
+        with self.lock:
+            data = {"max_concurrent": self.max_concurrent,
+                    "jobs": [{"model": job.model, "state": job.state} for job in self.jobs
+                             if job.state in PERSISTED_STATES]}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Błąd zapisu kolejki pobierania: {e}")
+
+    def notify(self, job, force=False):
+        now = time.perf_counter()
+        if not force and now - job.last_notified < UPDATE_INTERVAL:
+            return
+        job.last_notified = now
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def find(self, model):
+        for job in self.jobs:
+            if job.model == model:
+                return job
+        return None
+
+    def add(self, model):
+        with self.lock:
+            job = self.find(model)
+            if job is not None and job.state in (QUEUED, RUNNING):
+                return job
+            if job is None:
+                job = PullJob(model)
+                self.jobs.append(job)
+            job.state = QUEUED
+            job.error = None
+        self.save()
+        self.notify(job, force=True)
+        self.schedule()
+        return job
+
+    def set_max_concurrent(self, count):
+        with self.lock:
+            self.max_concurrent = max(1, count)
+        self.save()
+        self.schedule()
+
+    def schedule(self):
+        with self.lock:
+            if self.closing:
+                return
+            running = sum(1 for job in self.jobs if job.state == RUNNING)
+            starting = []
+            for job in self.jobs:
+                if running >= self.max_concurrent:
+                    break
+                if job.state == QUEUED:
+                    job.state = RUNNING
+                    job.stop_state = None
+                    starting.append(job)
+                    running += 1
+        for job in starting:
+            threading.Thread(target=self.run, args=(job,), daemon=True).start()
+        if starting:
+            self.save()
+
+    def run(self, job):
+        self.notify(job, force=True)
+        try:
+            process = subprocess.Popen([self.ollama_bin, "pull", job.model], stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            self.finish(job, FAILED, str(e))
+            return
+        with self.lock:
+            job.process = process
+            stop_state = job.stop_state
+        # A pause or cancel that came while the process was starting could not signal it yet
+        if stop_state is not None:
+            self.stop(job, stop_state)
+        buffer = ""
+        last_line = ""
+        while True:
+            data = os.read(job.process.stdout.fileno(), READ_SIZE)
+            if not data:
+                break
+            lines, buffer = split_lines(buffer, data.decode("utf-8", errors="replace"))
+            for line in lines:
+                job.update(line)
+                last_line = line
+            if lines:
+                self.notify(job)
+        returncode = job.process.wait()
+        job.process.stdout.close()
+        if job.stop_state is not None:
+            self.finish(job, job.stop_state)
+        elif returncode == 0:
+            self.finish(job, DONE)
+        else:
+            self.finish(job, FAILED, (buffer.strip() or last_line) or f"kod wyjścia {returncode}")
+
+    def finish(self, job, state, error=None):
+        with self.lock:
+            job.state = state
+            job.error = error
+            job.process = None
+            job.rate = 0.0
+            job.rate_time = None
+            if state == CANCELLED:
+                self.jobs.remove(job)
+        if not self.closing:
+            self.save()
+        self.notify(job, force=True)
+        if self.on_finished is not None:
+            self.on_finished(job)
+        self.schedule()
+
+    def stop(self, job, state):
+        with self.lock:
+            job.stop_state = state
+            process = job.process
+        if process is None or process.poll() is not None:
+            return
+        process.send_signal(signal.SIGINT)
+        killer = threading.Timer(STOP_GRACE, self.kill_if_running, args=(process,))
+        killer.daemon = True
+        killer.start()
+
+    def kill_if_running(self, process):
+        if process.poll() is None:
+            process.kill()
+
+    def pause(self, model):
+        with self.lock:
+            job = self.find(model)
+            if job is None or job.state not in (QUEUED, RUNNING):
+                return
+            running = job.state == RUNNING
+            if not running:
+                job.state = PAUSED
+        if running:
+            self.stop(job, PAUSED)
+        else:
+            self.save()
+            self.notify(job, force=True)
+
+    def resume(self, model):
+        with self.lock:
+            job = self.find(model)
+            if job is None or job.state != PAUSED:
+                return
+            job.state = QUEUED
+        self.save()
+        self.notify(job, force=True)
+        self.schedule()
+
+    def cancel(self, model):
+        with self.lock:
+            job = self.find(model)
+            if job is None:
+                return
+            running = job.state == RUNNING
+            if not running:
+                job.state = CANCELLED
+                self.jobs.remove(job)
+        if running:
+            self.stop(job, CANCELLED)
+        else:
+            self.save()
+            self.notify(job, force=True)
+
+    def close(self):
+        # Running pulls are stopped but stay in the saved queue, so they continue after a restart
+        with self.lock:
+            self.closing = True
+            running = [job for job in self.jobs if job.state == RUNNING]
+        self.save()
+        for job in running:
+            self.stop(job, QUEUED)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "chatbotapp")
+MEMORY_LIMIT_BYTES = 16 * 1024 * 1024
+DISK_LIMIT_BYTES = 256 * 1024 * 1024
+# Server statistics kept from the final chunk so cached replies still fill the context label
+FINAL_FIELDS = ("done_reason", "prompt_eval_count", "eval_count", "eval_duration")
+
+def model_name(model):
+    # "llama3" and "llama3:latest" are the same model for Ollama
+    return model if ":" in model else f"{model}:latest"
+
+def cache_key(model, options, messages):
+    # The whole request prefix is hashed, so any change to the history, system prompt or options is a miss
+    payload = json.dumps({"model": model_name(model), "options": options or {}, "messages": messages},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def final_fields(final):
+    # Accepts both the dict and the typed chunk of ollama's chat()
+    return {field: final.get(field) for field in FINAL_FIELDS} if final else {}
+
+def entry_size(entry):
+    return sum(len(chunk) for chunk in entry["chunks"]) + 256
+
+class ResponseCache:
+    # Replies stored as their streamed chunks, in an in-memory LRU backed by one JSON file per reply.
+    # Files live in a directory per model, so invalidating a model removes only its directory.
+    # Only the in-memory lookup is synchronous; disk work runs on one worker thread that owns the
+    # disk index, and those calls return futures like ConversationStore.
+    def __init__(self, cache_dir=CACHE_DIR, memory_limit=MEMORY_LIMIT_BYTES, disk_limit=DISK_LIMIT_BYTES):
+        self.root = os.path.join(cache_dir, "responses")
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.disk = None
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+
+    def model_dir(self, model):
+        return os.path.join(self.root, urllib.parse.quote(model_name(model), safe=""))
+
+    def entry_path(self, model, key):
+        return os.path.join(self.model_dir(model), key + ".json")
+
+    def scan_disk(self):
+        # Index of the files on disk, oldest first; built lazily on first use
+        if self.disk is not None:
+            return
+        files = []
+        if os.path.isdir(self.root):
+            for model_entry in os.scandir(self.root):
+                if not model_entry.is_dir():
+                    continue
+                for entry in os.scandir(model_entry.path):
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        self.disk = OrderedDict((path, size) for mtime, path, size in files)
+        self.disk_bytes = sum(self.disk.values())
+
+    def get(self, model, options, messages):
+        # Memory only; a miss here is looked up on disk with load()
+        key = cache_key(model, options, messages)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def load(self, model, options, messages):
+        return self.executor.submit(self._load, model, options, messages)
+
+    def _load(self, model, options, messages):
+        key = cache_key(model, options, messages)
+        entry = self.read_disk(model, key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.remember(key, entry)
+        return entry
+
+    def put(self, model, options, messages, chunks, final=None):
+        key = cache_key(model, options, messages)
+        entry = {"model": model_name(model), "created": time.time(), "chunks": list(chunks),
+                 "final": final_fields(final)}
+        with self.lock:
+            self.remember(key, entry)
+        return self.executor.submit(self.write_disk, model, key, entry)
+
+    def remember(self, key, entry):
+        if key in self.memory:
+            self.memory_bytes -= entry_size(self.memory.pop(key))
+        self.memory[key] = entry
+        self.memory_bytes += entry_size(entry)
+        while self.memory_bytes > self.memory_limit and len(self.memory) > 1:
+            key, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= entry_size(evicted)
+
+    def read_disk(self, model, key):
+        path = self.entry_path(model, key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # Touching the file keeps recently used replies at the end of the eviction order
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        if self.disk is not None and path in self.disk:
+            self.disk.move_to_end(path)
+        return entry
+
+    def write_disk(self, model, key, entry):
+        self.scan_disk()
+        path = self.entry_path(model, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(temp_path, path)
+            self.disk_bytes -= self.disk.pop(path, 0)
+            self.disk[path] = os.path.getsize(path)
+            self.disk_bytes += self.disk[path]
+        except OSError as e:
+            print(f"Błąd zapisu pamięci odpowiedzi: {e}")
+            return
+        while self.disk_bytes > self.disk_limit and len(self.disk) > 1:
+            oldest, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+
+    def invalidate(self, model=None):
+        # Drops the replies of one model, or of every model when none is given
+        with self.lock:
+            dropped = [key for key, entry in self.memory.items()
+                       if model is None or entry["model"] == model_name(model)]
+            for key in dropped:
+                self.memory_bytes -= entry_size(self.memory.pop(key))
+        return self.executor.submit(self.remove_disk, model)
+
+    def remove_disk(self, model):
+        self.scan_disk()
+        prefix = (self.model_dir(model) if model is not None else self.root) + os.sep
+        for path in [path for path in self.disk if path.startswith(prefix)]:
+            self.disk_bytes -= self.disk.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        with self.lock:
+            return (f"Pamięć odpowiedzi: trafienia {self.hits}, chybienia {self.misses} ({self.hit_rate:.0%}), "
+                    f"{len(self.memory)} w RAM ({self.memory_bytes / 1024:.0f} KiB), "
+                    f"dysk {self.disk_bytes / 1024 / 1024:.1f} MiB")
+
+    def close(self):
+        # Waits for pending writes, so replies cached just before closing are not lost
+        self.executor.shutdown(wait=True)
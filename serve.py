@@ -0,0 +1,525 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import asyncio
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry import Telemetry
+
+# Local OpenAI-style chat completions endpoint in front of one loaded model:
+#   python serve.py --backend transformers --model models/gpt2
+#   python serve.py --backend ollama --model llama3
+# POST /v1/chat/completions (with "stream": true for server-sent events), GET /v1/models, GET /metrics.
+MAX_CONCURRENCY = 4
+MAX_QUEUE = 16
+MAX_BATCH_SIZE = 8
+BATCH_WAIT_MS = 10
+DEFAULT_MAX_TOKENS = 256
+REQUEST_TIMEOUT = 300
+RETRY_AFTER_SECONDS = 1
+
+class ServeRequest:
+    # One chat completion; the backend pushes ("text", piece), ("done", finish_reason) or ("error", message)
+    def __init__(self, model, messages, max_tokens, temperature, top_p, timer):
+        self.id = f"chatcmpl-{uuid.uuid4().hex}"
+        self.created = int(time.time())
+        self.model = model
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.timer = timer
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def sampling_key(self):
+        return (self.temperature, self.top_p)
+
+def is_number(value):
+    # bool is an int subclass, but "temperature": true is not a temperature
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def sampling_options(body):
+    # Checked here so a bad value is a 400 for every backend and never fails a shared batch
+    max_tokens = body.get("max_tokens")
+    if max_tokens is None:
+        max_tokens = DEFAULT_MAX_TOKENS
+    elif not is_number(max_tokens) or (isinstance(max_tokens, float) and not max_tokens.is_integer()) \
+            or max_tokens < 1:
+        raise ValueError("max_tokens must be a positive integer")
+    temperature = body.get("temperature")
+    if temperature is not None and (not is_number(temperature) or not temperature >= 0):
+        raise ValueError("temperature must be a non-negative number")
+    top_p = body.get("top_p")
+    if top_p is not None and (not is_number(top_p) or not 0 < top_p <= 1):
+        raise ValueError("top_p must be a number in (0, 1]")
+    return int(max_tokens), temperature, top_p
+
+class Admission:
+    # Bounded number of requests either running or waiting; anything beyond is rejected with 429
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def try_enter(self):
+        with self.lock:
+            if self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+def chat_prompt(tokenizer, messages):
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    # Plain language models get the same newline-separated turns the Qt app feeds them
+    return "".join(f"{message['content']}\n" for message in messages)
+
+class BatchStreamer:
+    # generate() streamer for a whole batch: routes each row's new tokens to its own request
+    def __init__(self, tokenizer, requests, stop_ids):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.stop_ids = stop_ids
+        self.token_ids = [[] for _ in requests]
+        # Per row: where the last emitted text started and ended, so only a few tokens are decoded per step
+        self.prefix_offsets = [0] * len(requests)
+        self.read_offsets = [0] * len(requests)
+        self.finished = [False] * len(requests)
+        self.prompt_skipped = False
+
+    def put(self, value):
+        if not self.prompt_skipped:
+            # The first call carries the prompt ids
+            self.prompt_skipped = True
+            return
+        rows = value.reshape(len(self.requests), -1).tolist()
+        for index, tokens in enumerate(rows):
+            for token in tokens:
+                self.add_token(index, token)
+
+    def add_token(self, index, token):
+        if self.finished[index]:
+            return
+        request = self.requests[index]
+        if request.cancelled.is_set():
+            self.finish(index, "cancelled")
+            return
+        if token in self.stop_ids:
+            self.finish(index, "stop")
+            return
+        token_ids = self.token_ids[index]
+        token_ids.append(token)
+        prefix_offset, read_offset = self.prefix_offsets[index], self.read_offsets[index]
+        # The previous tokens are decoded along with the new ones, since tokenizers merge spaces across them
+        prefix_text = self.tokenizer.decode(token_ids[prefix_offset:read_offset], skip_special_tokens=True)
+        text = self.tokenizer.decode(token_ids[prefix_offset:], skip_special_tokens=True)
+        # A trailing replacement character means a multi-byte character is still incomplete
+        if not text.endswith("�") and len(text) > len(prefix_text):
+            request.timer.token()
+            request.events.put(("text", text[len(prefix_text):]))
+            self.prefix_offsets[index] = read_offset
+            self.read_offsets[index] = len(token_ids)
+        if len(self.token_ids[index]) >= request.max_tokens:
+            self.finish(index, "length")
+
+    def finish(self, index, reason):
+        self.finished[index] = True
+        request = self.requests[index]
+        request.completion_tokens = len(self.token_ids[index])
+        request.timer.finish(prompt_tokens=request.prompt_tokens, completion_tokens=request.completion_tokens)
+        request.events.put(("done", reason))
+
+    def end(self):
+        for index in range(len(self.requests)):
+            if not self.finished[index]:
+                self.finish(index, "length")
+
+    def all_finished(self):
+        return all(self.finished)
+
+class TransformersBackend:
+    # Requests that arrive within batch_wait_ms of each other share one padded generate() call.
+    # generate() cannot admit rows mid-call, so new requests join the next batch as soon as the current one ends.
+    def __init__(self, model_path, load_mode="fp32", max_batch_size=MAX_BATCH_SIZE, batch_wait_ms=BATCH_WAIT_MS):
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+        from chatbotapp import load_config, load_model, load_tokenizer, stop_token_ids
+
+        class BatchFinished(StoppingCriteria):
+            def __init__(self, streamer):
+                self.streamer = streamer
+
+            def __call__(self, input_ids, scores, **kwargs):
+                return self.streamer.all_finished()
+
+        self.torch = torch
+        self.stopping = lambda streamer: StoppingCriteriaList([BatchFinished(streamer)])
+        self.name = os.path.basename(os.path.normpath(model_path))
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_context_tokens = load_config()["max_context_tokens"]
+        self.tokenizer = load_tokenizer(model_path)
+        self.tokenizer.padding_side = "left"
+        # Long histories lose their oldest turns rather than the end the model continues from
+        self.tokenizer.truncation_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = load_model(model_path, load_mode)
+        self.stop_ids = stop_token_ids(self.model, self.tokenizer)
+        self.pending = queue.Queue()
+        self.deferred = deque()
+        self.batches = 0
+        self.batched_requests = 0
+        threading.Thread(target=self.schedule, daemon=True).start()
+
+    @property
+    def concurrency(self):
+        return self.max_batch_size
+
+    def models(self):
+        return [self.name]
+
+    def submit(self, request):
+        prompt = chat_prompt(self.tokenizer, request.messages)
+        limit = max(self.max_context_tokens - request.max_tokens, 1)
+        request.input_ids = self.tokenizer(prompt, truncation=True, max_length=limit)["input_ids"]
+        request.prompt_tokens = len(request.input_ids)
+        self.pending.put(request)
+
+    def collect_batch(self):
+        # Only requests with the same sampling settings can share a generate() call
+        first = self.deferred.popleft() if self.deferred else self.pending.get()
+        batch = [first]
+        skipped = []
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if self.deferred:
+                    request = self.deferred.popleft()
+                elif remaining > 0:
+                    request = self.pending.get(timeout=remaining)
+                else:
+                    request = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if request.sampling_key() == first.sampling_key():
+                batch.append(request)
+            else:
+                skipped.append(request)
+        self.deferred.extend(skipped)
+        return [request for request in batch if not request.cancelled.is_set()]
+
+    def schedule(self):
+        while True:
+            batch = self.collect_batch()
+            if batch:
+                self.run_batch(batch)
+
+    def run_batch(self, batch):
+        self.batches += 1
+        self.batched_requests += len(batch)
+        max_new_tokens = max(request.max_tokens for request in batch)
+        # Every row generates max_new_tokens, so prompts admitted with a smaller max_tokens may need cutting again
+        limit = max(self.max_context_tokens - max_new_tokens, 1)
+        for request in batch:
+            request.timer.start(self.name)
+            if len(request.input_ids) > limit:
+                request.input_ids = request.input_ids[-limit:]
+                request.prompt_tokens = limit
+        encoded = self.tokenizer.pad({"input_ids": [request.input_ids for request in batch]}, padding=True,
+                                     return_tensors="pt")
+        first = batch[0]
+        options = {"do_sample": False}
+        if first.temperature:
+            options = {"do_sample": True, "temperature": first.temperature, "top_p": first.top_p or 1.0}
+        streamer = BatchStreamer(self.tokenizer, batch, self.stop_ids)
+        try:
+            with self.torch.inference_mode():
+                self.model.generate(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"],
+                                    max_new_tokens=max_new_tokens,
+                                    pad_token_id=self.tokenizer.pad_token_id, streamer=streamer,
+                                    stopping_criteria=self.stopping(streamer), **options)
+            streamer.end()
+        except Exception as e:
+            for index, request in enumerate(batch):
+                if not streamer.finished[index]:
+                    streamer.finished[index] = True
+                    request.timer.finish(error=str(e))
+                    request.events.put(("error", str(e)))
+
+    def summary(self):
+        average = self.batched_requests / self.batches if self.batches else 0.0
+        return f"{self.batches} batches, {average:.2f} requests per batch"
+
+class OllamaBackend:
+    # Proxies to Ollama through the pooled client, with at most `concurrency` streams open at once
+    def __init__(self, default_model=None, concurrency=MAX_CONCURRENCY):
+        from ollama_pool import PooledOllamaClient
+
+        self.default_model = default_model
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.ollama = PooledOllamaClient()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self.make_semaphore(), self.loop).result()
+
+    async def make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    def models(self):
+        async def list_models():
+            response = await self.ollama.client.list()
+            return [entry.get("model") or entry.get("name") for entry in response["models"]]
+        return asyncio.run_coroutine_threadsafe(list_models(), self.loop).result(timeout=30)
+
+    def submit(self, request):
+        request.model = request.model or self.default_model
+        asyncio.run_coroutine_threadsafe(self.run(request), self.loop)
+
+    async def run(self, request):
+        async with self.semaphore:
+            if request.cancelled.is_set():
+                return
+            request.timer.start(request.model)
+            options = {"num_predict": request.max_tokens}
+            if request.temperature is not None:
+                options["temperature"] = request.temperature
+            if request.top_p is not None:
+                options["top_p"] = request.top_p
+            finish_reason = "stop"
+            try:
+                async for part in self.ollama.chat_stream(model=request.model, messages=request.messages,
+                                                          options=options):
+                    if request.cancelled.is_set():
+                        finish_reason = "cancelled"
+                        break
+                    content = part['message']['content']
+                    if content:
+                        request.timer.token()
+                        request.events.put(("text", content))
+                    if part.get('done'):
+                        request.prompt_tokens = part.get('prompt_eval_count') or 0
+                        request.completion_tokens = part.get('eval_count') or 0
+                        if part.get('done_reason') == 'length':
+                            finish_reason = "length"
+            except Exception as e:
+                request.timer.finish(error=str(e))
+                request.events.put(("error", str(e)))
+                return
+            request.timer.finish(prompt_tokens=request.prompt_tokens, completion_tokens=request.completion_tokens)
+            request.events.put(("done", finish_reason))
+
+    def summary(self):
+        return self.ollama.stats.summary()
+
+class ServeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, error_type, headers=None):
+        self.send_json({"error": {"message": message, "type": error_type, "code": status}}, status, headers)
+
+    def do_GET(self):
+        if self.path == "/v1/models":
+            try:
+                models = self.server.backend.models()
+            except Exception as e:
+                self.send_error_json(502, str(e), "backend_error")
+                return
+            self.send_json({"object": "list", "data": [{"id": model, "object": "model", "owned_by": "local"}
+                                                       for model in models]})
+        elif self.path == "/metrics":
+            body = self.server.telemetry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error_json(404, f"Unknown path {self.path}", "invalid_request_error")
+
+    def do_POST(self):
+        if self.path != "/v1/chat/completions":
+            self.send_error_json(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            messages = body["messages"]
+            if not isinstance(messages, list) or not messages:
+                raise ValueError("messages must be a non-empty list")
+            for message in messages:
+                if not isinstance(message, dict) or not isinstance(message.get("role"), str) \
+                        or not isinstance(message.get("content"), str):
+                    raise ValueError("every message must be an object with string role and content")
+            max_tokens, temperature, top_p = sampling_options(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, f"Invalid request: {e}", "invalid_request_error")
+            return
+
+        server = self.server
+        if not server.admission.try_enter():
+            self.send_error_json(429, "Server is at capacity, retry later", "rate_limit_error",
+                                 {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return
+        request = ServeRequest(body.get("model"), messages, max_tokens, temperature, top_p,
+                               server.telemetry.request())
+        try:
+            try:
+                server.backend.submit(request)
+            except Exception as e:
+                # E.g. a chat template that rejects the roles it was given
+                request.timer.finish(error=str(e))
+                self.send_error_json(400, f"Invalid request: {e}", "invalid_request_error")
+                return
+            if body.get("stream"):
+                self.stream_response(request)
+            else:
+                self.complete_response(request)
+        finally:
+            # Work for a client that went away is dropped at the next token
+            request.cancelled.set()
+            server.admission.leave()
+
+    def next_event(self, request):
+        try:
+            return request.events.get(timeout=REQUEST_TIMEOUT)
+        except queue.Empty:
+            return ("error", "timed out waiting for the model")
+
+    def response_model(self, request):
+        return request.model or self.server.model_name
+
+    def usage(self, request):
+        return {"prompt_tokens": request.prompt_tokens, "completion_tokens": request.completion_tokens,
+                "total_tokens": request.prompt_tokens + request.completion_tokens}
+
+    def complete_response(self, request):
+        pieces = []
+        while True:
+            kind, value = self.next_event(request)
+            if kind == "text":
+                pieces.append(value)
+            elif kind == "error":
+                self.send_error_json(502, value, "backend_error")
+                return
+            else:
+                break
+        self.send_json({
+            "id": request.id,
+            "object": "chat.completion",
+            "created": request.created,
+            "model": self.response_model(request),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)},
+                         "finish_reason": value}],
+            "usage": self.usage(request),
+        })
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def write_event(self, request, delta, finish_reason=None, usage=None):
+        chunk = {"id": request.id, "object": "chat.completion.chunk", "created": request.created,
+                 "model": self.response_model(request),
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        if usage is not None:
+            chunk["usage"] = usage
+        self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def stream_response(self, request):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.write_event(request, {"role": "assistant"})
+            while True:
+                kind, value = self.next_event(request)
+                if kind == "text":
+                    self.write_event(request, {"content": value})
+                elif kind == "error":
+                    self.write_chunk(f"data: {json.dumps({'error': {'message': value}})}\n\n".encode())
+                    break
+                else:
+                    self.write_event(request, {}, value, self.usage(request))
+                    break
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+class ServeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, backend, max_queue=MAX_QUEUE, telemetry=None):
+        super().__init__(address, ServeHandler)
+        self.backend = backend
+        self.telemetry = telemetry or Telemetry("serve")
+        self.admission = Admission(backend.concurrency + max_queue)
+        self.model_name = getattr(backend, "name", None)
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible chat completions server for local models")
+    parser.add_argument("--backend", choices=["transformers", "ollama"], default="transformers")
+    parser.add_argument("--model", help="Model directory for transformers, default model name for ollama")
+    parser.add_argument("--load-mode", default="fp32", help="transformers load mode: fp32, mmap, bf16 or int8")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="Parallel Ollama streams (ollama backend)")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="Requests per generate() call (transformers backend)")
+    parser.add_argument("--batch-wait-ms", type=float, default=BATCH_WAIT_MS)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help="Requests allowed to wait beyond the running ones before answering 429")
+    args = parser.parse_args()
+
+    if args.backend == "transformers":
+        if not args.model:
+            parser.error("--model is required for the transformers backend")
+        backend = TransformersBackend(args.model, args.load_mode, args.max_batch_size, args.batch_wait_ms)
+    else:
+        backend = OllamaBackend(args.model, args.max_concurrency)
+    server = ServeServer((args.host, args.port), backend, args.max_queue)
+    print(f"Serving {args.backend} on http://{args.host}:{server.server_address[1]}/v1/chat/completions",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(backend.summary(), file=sys.stderr)
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
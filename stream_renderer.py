@@ -0,0 +1,46 @@
+import threading
+
+from gi.repository import GLib
+
+FLUSH_INTERVAL_MS = 16
+
+class StreamRenderer:
+    # Collects text from any thread and writes it into a Gtk.TextBuffer at most once per interval,
+    # as a single insert at a mark that stays at the end of the buffer
+    def __init__(self, buffer, interval_ms=FLUSH_INTERVAL_MS):
+        self.buffer = buffer
+        self.interval_ms = interval_ms
+        self.end_mark = buffer.create_mark(None, buffer.get_end_iter(), False)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.scheduled = False
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        if not text:
+            return
+        with self.lock:
+            self.pending.append(text)
+            self.writes += 1
+            if self.scheduled:
+                return
+            self.scheduled = True
+        if self.interval_ms > 0:
+            GLib.timeout_add(self.interval_ms, self.flush)
+        else:
+            GLib.idle_add(self.flush)
+
+    def flush(self):
+        with self.lock:
+            text = "".join(self.pending)
+            self.pending = []
+            self.scheduled = False
+        if text:
+            self.flushes += 1
+            self.buffer.insert(self.buffer.get_iter_at_mark(self.end_mark), text)
+        return False
+
+    def discard(self):
+        with self.lock:
+            self.pending = []
@@ -0,0 +1,236 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of observations
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def lines(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+class ModelMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.ttft = Histogram()
+        self.inter_token = Histogram()
+        self.queue_wait = Histogram()
+        self.duration = Histogram()
+
+class RequestTimer:
+    # Timeline of one request: queued -> started -> first token -> each following token -> finished.
+    # Streamed chunks are counted as tokens unless the backend reports exact counts at the end.
+    def __init__(self, telemetry, model=None):
+        self.telemetry = telemetry
+        self.model = model
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.first_token_at = None
+        self.last_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.gaps = []
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.error = None
+
+    def start(self, model=None):
+        if model is not None:
+            self.model = model
+        self.started_at = time.perf_counter()
+
+    def token(self):
+        now = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.chunks += 1
+
+    def finish(self, prompt_tokens=None, completion_tokens=None, error=None):
+        self.finished_at = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = self.finished_at
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens if completion_tokens is not None else self.chunks
+        self.error = error
+        self.telemetry.record(self)
+
+    @property
+    def queue_wait(self):
+        return self.started_at - self.queued_at if self.started_at is not None else None
+
+    @property
+    def ttft(self):
+        return self.first_token_at - self.started_at if self.first_token_at is not None else None
+
+    @property
+    def total(self):
+        return self.finished_at - self.started_at if self.finished_at is not None else None
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.last_token_at is None or self.last_token_at <= self.first_token_at:
+            return None
+        return (self.completion_tokens - 1) / (self.last_token_at - self.first_token_at)
+
+class Telemetry:
+    # Per-model request metrics shared by the GTK and Qt front-ends, exported in the Prometheus text format
+    def __init__(self, app, textfile=None):
+        self.app = app
+        self.textfile = textfile
+        self.lock = threading.Lock()
+        self.models = {}
+        self.last_request = None
+        self.server = None
+
+    def request(self, model=None):
+        return RequestTimer(self, model)
+
+    def record(self, timer):
+        with self.lock:
+            metrics = self.models.setdefault(timer.model or "unknown", ModelMetrics())
+            metrics.requests += 1
+            if timer.error is not None:
+                metrics.errors += 1
+            if timer.queue_wait is not None:
+                metrics.queue_wait.observe(timer.queue_wait)
+            if timer.ttft is not None:
+                metrics.ttft.observe(timer.ttft)
+            for gap in timer.gaps:
+                metrics.inter_token.observe(gap)
+            if timer.total is not None:
+                metrics.duration.observe(timer.total)
+            metrics.prompt_tokens += timer.prompt_tokens or 0
+            metrics.completion_tokens += timer.completion_tokens or 0
+            self.last_request = timer
+        if self.textfile:
+            try:
+                self.write_textfile(self.textfile)
+            except OSError as e:
+                print(f"Error writing metrics to {self.textfile}: {e}")
+
+    def render(self):
+        lines = []
+        histograms = (("chat_time_to_first_token_seconds", "ttft", "Time from request start to the first token"),
+                      ("chat_inter_token_seconds", "inter_token", "Gap between consecutive streamed tokens"),
+                      ("chat_queue_wait_seconds", "queue_wait", "Time a request waited before it started"),
+                      ("chat_request_duration_seconds", "duration", "Time from request start to the last token"))
+        counters = (("chat_requests_total", "requests", "Finished requests"),
+                    ("chat_request_errors_total", "errors", "Failed requests"),
+                    ("chat_prompt_tokens_total", "prompt_tokens", "Prompt tokens"),
+                    ("chat_completion_tokens_total", "completion_tokens", "Generated tokens"))
+        with self.lock:
+            for name, attribute, help_text in counters:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for model, metrics in self.models.items():
+                    labels = {"app": self.app, "model": model}
+                    lines.append(f"{name}{format_labels(labels)} {getattr(metrics, attribute)}")
+            for name, attribute, help_text in histograms:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for model, metrics in self.models.items():
+                    lines.extend(getattr(metrics, attribute).lines(name, {"app": self.app, "model": model}))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Written atomically so a scraper never reads a half-written file
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.render())
+        os.replace(temp_path, path)
+
+    def snapshot(self):
+        # Per-model aggregates for the live overlays; the front-ends format them in their own language
+        with self.lock:
+            return {model: {"requests": metrics.requests,
+                            "errors": metrics.errors,
+                            "ttft_p50": metrics.ttft.quantile(0.5),
+                            "inter_token_p95": metrics.inter_token.quantile(0.95)}
+                    for model, metrics in self.models.items()}
+
+    def serve(self, port, host="127.0.0.1"):
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def from_environment(app):
+    # CHAT_METRICS_FILE enables the text file export, CHAT_METRICS_PORT the /metrics endpoint
+    telemetry = Telemetry(app, textfile=os.environ.get("CHAT_METRICS_FILE") or None)
+    port = os.environ.get("CHAT_METRICS_PORT")
+    if port:
+        telemetry.serve(int(port))
+    return telemetry